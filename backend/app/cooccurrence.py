@@ -0,0 +1,146 @@
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from . import metrics
+
+class CooccurrenceIndex:
+    """Sparse item-item matrix counting how often two products were shown in the same turn.
+
+    Stored as an adjacency dict (product_id -> Counter of product_id), plus
+    the number of turns each product was shown in, so updates and lookups
+    are a few dict operations. Snapshots are written
+    as JSON by a background thread, never on the request path.
+
+    Several worker processes share one snapshot file, so each worker also
+    keeps the counts it added since its last save and merges only those into
+    the file under a file lock, then adopts the merged totals.
+    """
+
+    def __init__(self):
+        self._neighbors: Dict[str, Counter] = defaultdict(Counter)
+        self._shown: Counter = Counter()
+        # Counts added since the last save, merged into the snapshot file on save
+        self._pending_neighbors: Dict[str, Counter] = defaultdict(Counter)
+        self._pending_shown: Counter = Counter()
+        self._lock = threading.Lock()
+        self._dirty = False
+        metrics.register_gauge("cooccurrence.products", lambda: len(self._neighbors))
+
+    def add_products(self, product_ids: Iterable[str]) -> None:
+        """Record one turn's products_shown."""
+        ids = list(dict.fromkeys(str(pid) for pid in product_ids if pid))
+        if len(ids) < 2:
+            return
+        with self._lock:
+            self._shown.update(ids)
+            self._pending_shown.update(ids)
+            for pid in ids:
+                neighbors = self._neighbors[pid]
+                pending = self._pending_neighbors[pid]
+                for other in ids:
+                    if other != pid:
+                        neighbors[other] += 1
+                        pending[other] += 1
+            self._dirty = True
+        metrics.increment("cooccurrence.turns")
+
+    def related(self, product_id: str, limit: int = 5) -> List[Tuple[str, int]]:
+        """Products most often shown together with product_id, with their counts."""
+        with self._lock:
+            neighbors = self._neighbors.get(str(product_id))
+            return neighbors.most_common(limit) if neighbors else []
+
+    def scores(self, seed_ids: Iterable[str]) -> Dict[str, float]:
+        """Co-occurrence of other products with the seed products, normalized to [0, 1].
+
+        The seeds themselves are left out: they are usually the previous
+        turn's products, which were all shown together, so they would
+        otherwise score highest and be pushed back to the top. Each pair
+        count is divided by sqrt(shown(seed) * shown(product)) so products
+        that are shown with everything don't dominate.
+        """
+        seeds = {str(pid) for pid in seed_ids}
+        totals: Dict[str, float] = defaultdict(float)
+        with self._lock:
+            for seed in seeds:
+                neighbors = self._neighbors.get(seed)
+                if not neighbors:
+                    continue
+                for pid, count in neighbors.items():
+                    if pid not in seeds:
+                        totals[pid] += count / math.sqrt(self._shown[seed] * self._shown[pid])
+        if not totals:
+            return {}
+        top = max(totals.values())
+        return {pid: count / top for pid, count in totals.items()}
+
+    def save(self, path: Path) -> None:
+        """Merge the counts added since the last save into the snapshot at path and adopt the result."""
+        with self._lock:
+            pending_neighbors, self._pending_neighbors = self._pending_neighbors, defaultdict(Counter)
+            pending_shown, self._pending_shown = self._pending_shown, Counter()
+            self._dirty = False
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix(".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            neighbors, shown = self._read(path)
+            for pid, counts in pending_neighbors.items():
+                neighbors[pid].update(counts)
+            shown.update(pending_shown)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"neighbors": {pid: dict(counts) for pid, counts in neighbors.items()},
+                           "shown": dict(shown)}, f)
+            os.replace(tmp_path, path)
+        self._adopt(neighbors, shown)
+
+    def load(self, path: Path) -> int:
+        """Replace the matrix with a snapshot. Returns the number of products loaded."""
+        neighbors, shown = self._read(path)
+        self._adopt(neighbors, shown)
+        if neighbors:
+            print(f"Loaded co-occurrence index for {len(neighbors)} products")
+        return len(neighbors)
+
+    def _read(self, path: Path) -> Tuple[Dict[str, Counter], Counter]:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return defaultdict(Counter), Counter()
+        except Exception as e:
+            print(f"Error loading co-occurrence snapshot {path}: {e}")
+            return defaultdict(Counter), Counter()
+        neighbors = defaultdict(Counter, {pid: Counter(counts) for pid, counts in data["neighbors"].items()})
+        return neighbors, Counter(data["shown"])
+
+    def _adopt(self, neighbors: Dict[str, Counter], shown: Counter) -> None:
+        """Use the snapshot's totals plus whatever was added since it was taken."""
+        neighbors = defaultdict(Counter, {pid: Counter(counts) for pid, counts in neighbors.items()})
+        shown = Counter(shown)
+        with self._lock:
+            for pid, counts in self._pending_neighbors.items():
+                neighbors[pid].update(counts)
+            shown.update(self._pending_shown)
+            self._neighbors = neighbors
+            self._shown = shown
+
+    def start_autosave(self, path: Path, interval: float = 60) -> None:
+        """Snapshot to path every interval seconds while there are unsaved updates."""
+        def run():
+            while True:
+                time.sleep(interval)
+                if self._dirty:
+                    try:
+                        self.save(path)
+                    except Exception as e:
+                        print(f"Error saving co-occurrence snapshot: {e}")
+        threading.Thread(target=run, name="cooccurrence-autosave", daemon=True).start()
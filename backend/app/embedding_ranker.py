@@ -0,0 +1,129 @@
+import threading
+from typing import Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+class ProductEmbeddingIndex:
+    """In-memory matrix of the product embeddings stored in the Chroma collection.
+
+    Rows are L2-normalized, so cosine similarity with a query is a single
+    matrix-vector product. Reloaded whenever the collection's data version
+    changes (see ensure_loaded).
+    """
+
+    def __init__(self):
+        self.product_ids: List[str] = []
+        self.matrix: Optional[np.ndarray] = None
+        self.version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    def load(self, collection, version: Optional[str] = None) -> int:
+        """Read every catalog product embedding (ids product_{product_id}) from the collection."""
+        results = collection.get(where={"source": "catalog"}, include=["embeddings", "metadatas"])
+        ids = results.get("ids") or []
+        embeddings = results.get("embeddings")
+        metadatas = results.get("metadatas") or [{}] * len(ids)
+
+        product_ids = []
+        for doc_id, metadata in zip(ids, metadatas):
+            product_id = (metadata or {}).get("product_id") or doc_id[len("product_"):]
+            product_ids.append(str(product_id))
+
+        if product_ids and embeddings is not None and len(embeddings) == len(product_ids):
+            matrix = np.asarray(embeddings, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1.0, norms)
+        else:
+            product_ids, matrix = [], None
+
+        with self._lock:
+            self.product_ids = product_ids
+            self.matrix = matrix
+            self.version = version
+        print(f"Loaded {len(product_ids)} product embeddings into memory")
+        return len(product_ids)
+
+    def ensure_loaded(self, collection, version: str) -> bool:
+        """Reload the matrix if the collection changed since the last load. Returns True if usable."""
+        if collection is None:
+            return False
+        if self.version != version:
+            try:
+                self.load(collection, version)
+            except Exception as e:
+                print(f"Error loading product embeddings: {e}")
+                with self._lock:
+                    self.product_ids, self.matrix, self.version = [], None, version
+        return self.matrix is not None
+
+    def build_features(self, products: Sequence[Mapping], margin_bonus: Sequence[float],
+                       preference_bonus: Mapping[str, Sequence[float]]) -> Optional["RankingFeatures"]:
+        """Ranking features for a catalog against the currently loaded matrix, or None if nothing is loaded."""
+        with self._lock:
+            matrix, product_ids, version = self.matrix, self.product_ids, self.version
+        if matrix is None:
+            return None
+        return RankingFeatures(products, matrix, product_ids, version, margin_bonus, preference_bonus)
+
+class RankingFeatures:
+    """Per-product ranking inputs aligned with one catalog's product order.
+
+    Holds the embedding matrix it was built against, the matrix row of each
+    product (-1 for products without an embedding), each product's margin
+    bonus and one preference-bonus array per preference key. Ranking a query
+    is then one matrix-vector product plus vector arithmetic, with no
+    per-product Python work. Built once per catalog and index version.
+
+    Bonus columns that are already float64 arrays, such as the shared
+    catalog's derived columns, are used without copying.
+    """
+
+    def __init__(self, products: Sequence[Mapping], matrix: np.ndarray, index_ids: List[str], version: Optional[str],
+                 margin_bonus: Sequence[float], preference_bonus: Mapping[str, Sequence[float]]):
+        self.products = products
+        self.matrix = matrix
+        self.version = version
+        product_ids = [str(p.get('product_id')) for p in products]
+        self.positions = {pid: i for i, pid in enumerate(product_ids)}
+        index_rows = {pid: row for row, pid in enumerate(index_ids)}
+        self.rows = np.array([index_rows.get(pid, -1) for pid in product_ids], dtype=np.int64)
+        self.margin_bonus = np.asarray(margin_bonus, dtype=np.float64)
+        self.preference_bonus: Dict[str, np.ndarray] = {
+            key: np.asarray(column, dtype=np.float64) for key, column in preference_bonus.items()
+        }
+
+    def similarities(self, query_embedding) -> np.ndarray:
+        """Cosine similarity of the query with each product (0 for products without an embedding)."""
+        query_vector = np.asarray(query_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query_vector)
+        if norm == 0:
+            return np.zeros(len(self.rows))
+        scores = self.matrix @ (query_vector / norm)
+        return np.where(self.rows >= 0, scores[self.rows], 0.0)
+
+    def preference_scores(self, keys: List[str]) -> np.ndarray:
+        """Sum of the preference-bonus arrays for the given keys (see preference_keys)."""
+        scores = np.zeros(len(self.rows))
+        for key in keys:
+            if key in self.preference_bonus:
+                scores += self.preference_bonus[key]
+        return scores
+
+    def add_bonus(self, scores: np.ndarray, bonus: Dict[str, float], weight: float) -> None:
+        """Add weight * bonus[product_id] in place for a sparse product_id -> bonus mapping."""
+        for pid, value in bonus.items():
+            position = self.positions.get(pid)
+            if position is not None:
+                scores[position] += weight * value
+
+    def top(self, scores: np.ndarray, limit: int) -> List[Mapping]:
+        """The limit highest-scoring products, best first."""
+        limit = min(limit, len(scores))
+        if limit <= 0:
+            return []
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [self.products[i] for i in best.tolist()]
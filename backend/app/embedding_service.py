@@ -0,0 +1,189 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from chromadb.utils import embedding_functions
+
+from . import metrics
+
+MAX_TOKENS = 256
+
+class EmbeddingService:
+    """App-owned query/document embedder using Chroma's default all-MiniLM-L6-v2 ONNX model.
+
+    Compared with calling DefaultEmbeddingFunction directly it:
+    - loads and warms the model up front instead of on the first query,
+    - runs ONNX with configurable intra/inter-op thread counts,
+    - can use a dynamically int8-quantized copy of the model,
+    - pads batches to their longest input instead of always to 256 tokens,
+    - micro-batches concurrent single-query calls that arrive within
+      batch_window_ms into one model run, and
+    - remembers the embeddings of recent queries (retrieval and ranking
+      embed the same query).
+
+    Instances are Chroma embedding functions, so the same object is used for
+    ingestion (process_docs.py) and querying. Embeddings match the default
+    function up to float rounding; the quantized model trades a little
+    accuracy for speed.
+    """
+
+    def __init__(self, intra_op_threads: int = 0, inter_op_threads: int = 0, quantized: bool = False,
+                 batch_window_ms: float = 3.0, max_batch: int = 32, cache_size: int = 1024, warmup: bool = True):
+        self.quantized = quantized
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+
+        start = time.perf_counter()
+        model_dir = self._ensure_model_downloaded()
+        self._load(model_dir, intra_op_threads, inter_op_threads)
+        if warmup:
+            self._forward(["warmup query for the embedding model"])
+        print(f"Embedding model ready in {time.perf_counter() - start:.2f}s "
+              f"(quantized: {quantized}, intra-op threads: {intra_op_threads or 'default'})")
+
+        threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True).start()
+        metrics.register_gauge("embedding.queue_depth", self._queue.qsize)
+
+    @staticmethod
+    def _ensure_model_downloaded() -> Path:
+        """Let Chroma download its default model if needed and return the directory holding it."""
+        default_fn = embedding_functions.DefaultEmbeddingFunction()
+        default_fn._download_model_if_not_exists()
+        return Path(default_fn.DOWNLOAD_PATH) / default_fn.EXTRACTED_FOLDER_NAME
+
+    def _load(self, model_dir: Path, intra_op_threads: int, inter_op_threads: int) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = model_dir / "model.onnx"
+        if self.quantized:
+            model_path = self._quantize(model_path)
+
+        options = ort.SessionOptions()
+        options.log_severity_level = 3
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+        self.session = ort.InferenceSession(str(model_path), sess_options=options,
+                                            providers=["CPUExecutionProvider"])
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_TOKENS)
+        # Pad to the longest input in the batch; masked mean pooling makes padding length irrelevant
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+    @staticmethod
+    def _quantize(model_path: Path) -> Path:
+        """Create (once) a dynamically int8-quantized copy of the model next to the original.
+
+        Worker processes may quantize concurrently, so each writes its own
+        temporary file and renames it into place; the final path never holds
+        a partially written model.
+        """
+        quantized_path = model_path.with_name("model.int8.onnx")
+        if not quantized_path.exists():
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            print(f"Quantizing embedding model to {quantized_path}")
+            tmp_path = model_path.with_name(f"model.int8.{os.getpid()}.tmp.onnx")
+            try:
+                quantize_dynamic(str(model_path), str(tmp_path), weight_type=QuantType.QInt8)
+                os.replace(tmp_path, quantized_path)
+            finally:
+                tmp_path.unlink(missing_ok=True)
+        return quantized_path
+
+    def _forward(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in one model run (mean pooling + L2 normalization, as Chroma does)."""
+        encoded = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        last_hidden_state = self.session.run(None, {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "token_type_ids": np.zeros_like(input_ids),
+        })[0]
+        mask = np.expand_dims(attention_mask, -1).astype(np.float32)
+        embeddings = (last_hidden_state * mask).sum(1) / np.clip(mask.sum(1), 1e-9, None)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.where(norms == 0, 1.0, norms)
+        metrics.increment("embedding.batches")
+        metrics.increment("embedding.texts", len(texts))
+        return embeddings.astype(np.float32)
+
+    def _batch_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self._forward(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (text, future), embedding in zip(batch, embeddings):
+                self._remember(text, embedding)
+                future.set_result(embedding)
+
+    def _remember(self, text: str, embedding: np.ndarray) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[text] = embedding
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embed one query, sharing a model run with concurrent callers."""
+        with self._cache_lock:
+            cached = self._cache.get(text)
+        if cached is not None:
+            metrics.increment("embedding.cache_hits")
+            return cached
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        """Chroma EmbeddingFunction interface."""
+        texts = list(input)
+        if len(texts) == 1:
+            return [self.embed_query(texts[0]).tolist()]
+        # Bulk calls (ingestion) bypass the micro-batcher and run in fixed-size batches
+        embeddings = [self._forward(texts[i:i + self.max_batch]) for i in range(0, len(texts), self.max_batch)]
+        return np.concatenate(embeddings).tolist() if embeddings else []
+
+def create_embedding_service(warmup: bool = True) -> Optional[EmbeddingService]:
+    """Build the service from EMBEDDING_* environment variables (None if the model can't be loaded)."""
+    try:
+        return EmbeddingService(
+            intra_op_threads=int(os.getenv("EMBEDDING_INTRA_OP_THREADS", "0")),
+            inter_op_threads=int(os.getenv("EMBEDDING_INTER_OP_THREADS", "0")),
+            quantized=os.getenv("EMBEDDING_QUANTIZED", "0").lower() in ("1", "true", "yes"),
+            batch_window_ms=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "3")),
+            max_batch=int(os.getenv("EMBEDDING_MAX_BATCH", "32")),
+            warmup=warmup,
+        )
+    except Exception as e:
+        print(f"Error initializing embedding service: {e}")
+        return None
@@ -0,0 +1,80 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from . import metrics
+from .profiler import run_attached
+
+class ExecutorSaturated(Exception):
+    """Raised when an executor's queue is full and new work is rejected."""
+
+class BoundedExecutor(Executor):
+    """Thread pool with a limit on queued work.
+
+    Submitting more than max_workers + max_queue outstanding tasks raises
+    ExecutorSaturated instead of queueing, so callers can shed load fast.
+    Queue depth and active workers are exposed as gauges in /metrics.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._pending = 0
+        self._running = 0
+        self._lock = threading.Lock()
+        metrics.register_gauge(f"executor.{name}.queue_depth", lambda: self.queue_depth)
+        metrics.register_gauge(f"executor.{name}.active", lambda: self._running)
+
+    @property
+    def queue_depth(self) -> int:
+        """Tasks submitted but not yet picked up by a worker."""
+        return self._pending - self._running
+
+    def saturated(self) -> bool:
+        return self._pending >= self.max_workers + self.max_queue
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._lock:
+            if self.saturated():
+                metrics.increment(f"executor.{self.name}.rejected")
+                raise ExecutorSaturated(f"{self.name} executor queue is full")
+            self._pending += 1
+
+        def task():
+            with self._lock:
+                self._running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        try:
+            future = self._executor.submit(task)
+        except BaseException:
+            self._release(None)
+            raise
+        # Runs on completion and on cancellation before start, so pending never leaks
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn on this executor and await its result from the event loop.
+
+        fn runs in a copy of the caller's context, so context variables set by
+        the request are visible in the worker thread, and the worker is
+        sampled while it runs fn if the request is being profiled.
+        """
+        context = contextvars.copy_context()
+        return await asyncio.wrap_future(self.submit(context.run, run_attached, fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True, **kwargs) -> None:
+        self._executor.shutdown(wait=wait, **kwargs)
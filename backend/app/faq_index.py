@@ -0,0 +1,77 @@
+import re
+from typing import Any, Dict, List, Optional, Set
+
+from . import metrics
+
+# The FAQ index is a companion collection of the versioned docs collection,
+# e.g. skincare_docs_v20240101T120000123456_faq, holding one document per
+# customer-ticket question with the support answer in its metadata.
+FAQ_SUFFIX = "_faq"
+
+# Tickets about a specific order get answers that only apply to that customer
+# (tracking numbers, refunds), so they are left out of the FAQ.
+ORDER_SPECIFIC_TERMS = ["order", "delivered", "delivery", "tracking", "package", "parcel", "shipping",
+                        "shipped", "refund", "replacement", "arrived", "leaking"]
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "be", "it", "this", "that", "these", "those", "my", "your", "our",
+    "i", "you", "we", "me", "of", "to", "in", "on", "for", "with", "and", "or", "any", "do", "does", "can",
+    "will", "would", "should", "what", "how", "which", "there", "have", "has", "hi", "hello", "please",
+    "during", "while", "when", "if", "but", "so", "at", "as", "use", "using",
+}
+
+def faq_collection_name(collection_name: str) -> str:
+    return f"{collection_name}{FAQ_SUFFIX}"
+
+def is_order_specific(question: str) -> bool:
+    question_lower = question.lower()
+    return any(re.search(rf"\b{term}\b", question_lower) for term in ORDER_SPECIFIC_TERMS)
+
+def content_terms(text: str) -> Set[str]:
+    """Lowercased words of a text minus stopwords, for the lexical side of FAQ matching.
+
+    Words are cut to six letters as a crude stemmer ("pregnant" and "pregnancy" match).
+    """
+    return {word[:6] for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS}
+
+def term_overlap(query: str, question: str) -> float:
+    """Share of the FAQ question's content words that also appear in the query."""
+    question_terms = content_terms(question)
+    if not question_terms:
+        return 0.0
+    return len(question_terms & content_terms(query)) / len(question_terms)
+
+def find_faq_answer(faq_collection, query: str, min_similarity: float, min_overlap: float) -> Optional[Dict[str, Any]]:
+    """Return the best FAQ entry for a query if it passes both the vector and the lexical threshold.
+
+    The FAQ collection uses cosine space, so similarity is 1 - distance.
+    The lexical check stops near-identical questions about a different product
+    ("is Sunrise Retinal Serum safe during pregnancy?" vs the same question
+    about a peel mask) from matching on embedding similarity alone.
+    """
+    if faq_collection is None:
+        return None
+    try:
+        if faq_collection.count() == 0:
+            return None
+        results = faq_collection.query(query_texts=[query], n_results=min(3, faq_collection.count()),
+                                       include=["documents", "metadatas", "distances"])
+    except Exception as e:
+        print(f"Error querying FAQ index: {e}")
+        return None
+
+    candidates: List[Dict[str, Any]] = []
+    for question, metadata, distance in zip(results["documents"][0], results["metadatas"][0], results["distances"][0]):
+        similarity = 1 - distance
+        overlap = term_overlap(query, question)
+        if similarity >= min_similarity and overlap >= min_overlap:
+            candidates.append({**metadata, "question": question, "similarity": similarity, "overlap": overlap})
+    if not candidates:
+        metrics.increment("faq.misses")
+        return None
+    metrics.increment("faq.hits")
+    return max(candidates, key=lambda c: (c["similarity"], c["overlap"]))
+
+def format_faq_answer(match: Dict[str, Any]) -> str:
+    """Answer text with a citation of the support ticket it comes from."""
+    return f"{match['answer']} (Source: customer support ticket {match['ticket_id']})"
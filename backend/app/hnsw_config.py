@@ -0,0 +1,24 @@
+import os
+from typing import Any, Dict, Optional
+
+# Chroma's own defaults, so an unconfigured index behaves exactly as before
+HNSW_DEFAULTS: Dict[str, Any] = {"space": "l2", "M": 16, "construction_ef": 100, "search_ef": 10}
+HNSW_SPACES = ("l2", "cosine", "ip")
+
+def hnsw_metadata(space: Optional[str] = None, M: Optional[int] = None,
+                  construction_ef: Optional[int] = None, search_ef: Optional[int] = None) -> Dict[str, Any]:
+    """Collection metadata setting Chroma's HNSW parameters.
+
+    Arguments left as None come from HNSW_SPACE, HNSW_M, HNSW_CONSTRUCTION_EF
+    and HNSW_SEARCH_EF, falling back to Chroma's defaults. The parameters are
+    fixed when the collection is created, so changing them takes a reindex.
+    """
+    space = (space or os.getenv("HNSW_SPACE", HNSW_DEFAULTS["space"])).lower()
+    if space not in HNSW_SPACES:
+        raise ValueError(f"HNSW space must be one of {HNSW_SPACES}, got {space!r}")
+    return {
+        "hnsw:space": space,
+        "hnsw:M": M or int(os.getenv("HNSW_M", HNSW_DEFAULTS["M"])),
+        "hnsw:construction_ef": construction_ef or int(os.getenv("HNSW_CONSTRUCTION_EF", HNSW_DEFAULTS["construction_ef"])),
+        "hnsw:search_ef": search_ef or int(os.getenv("HNSW_SEARCH_EF", HNSW_DEFAULTS["search_ef"])),
+    }
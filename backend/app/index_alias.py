@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from .faq_index import FAQ_SUFFIX, faq_collection_name
+
+# Chroma has no collection aliases, so the name of the live collection is kept in
+# a small pointer file next to the database. Ingestion builds a new versioned
+# collection, validates it and then atomically replaces the pointer; the API
+# re-reads the pointer whenever the file changes.
+ALIAS_NAME = "skincare_docs"
+ALIAS_FILE = "active_collection.json"
+VERSION_PREFIX = f"{ALIAS_NAME}_v"
+
+def new_version_name() -> str:
+    """Name for a new shadow collection, e.g. skincare_docs_v20240101T120000123456."""
+    return f"{VERSION_PREFIX}{datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+
+def read_active(chroma_dir: Path) -> Optional[str]:
+    """Return the collection name the alias points to, or None if no alias was written yet."""
+    try:
+        with open(Path(chroma_dir) / ALIAS_FILE) as f:
+            return json.load(f).get("collection")
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading collection alias: {e}")
+        return None
+
+def read_history(chroma_dir: Path) -> List[str]:
+    """Return the collections the alias has pointed to, oldest first."""
+    try:
+        with open(Path(chroma_dir) / ALIAS_FILE) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        print(f"Error reading collection alias: {e}")
+        return []
+    history = data.get("history") or []
+    if data.get("collection") and data["collection"] not in history:
+        history.append(data["collection"])
+    return history
+
+def write_active(chroma_dir: Path, collection_name: str, document_count: int) -> None:
+    """Atomically point the alias at collection_name and record it in the activation history."""
+    path = Path(chroma_dir) / ALIAS_FILE
+    history = [name for name in read_history(chroma_dir) if name != collection_name] + [collection_name]
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "collection": collection_name,
+            "document_count": document_count,
+            "activated_at": datetime.now().isoformat(),
+            "history": history,
+        }, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def collect_garbage(chroma_client, chroma_dir: Path, active_name: str, keep: int = 2) -> List[str]:
+    """Delete old versioned collections, keeping the newest `keep` activated ones (including the active one).
+
+    Only versions the alias actually pointed to count towards `keep`, so the
+    previous live version is kept for rolling back a bad catalog even when
+    failed builds left newer collections behind; those are deleted. The legacy
+    unversioned collection is removed once an alias exists. A version's FAQ
+    companion collection is deleted together with it.
+    """
+    names = [c.name for c in chroma_client.list_collections()]
+    versions = sorted((n for n in names if n.startswith(VERSION_PREFIX) and not n.endswith(FAQ_SUFFIX)), reverse=True)
+    activated = [name for name in read_history(chroma_dir) if name in versions]
+    retained = set(activated[-keep:]) | {active_name}
+    deleted = []
+    for name in versions + ([ALIAS_NAME] if ALIAS_NAME in names else []):
+        if name in retained:
+            continue
+        for collection_name in [name] + ([faq_collection_name(name)] if faq_collection_name(name) in names else []):
+            try:
+                chroma_client.delete_collection(collection_name)
+                deleted.append(collection_name)
+            except Exception as e:
+                print(f"Error deleting old collection {collection_name}: {e}")
+    if deleted:
+        print(f"Garbage-collected old collections: {deleted}")
+    return deleted
+
+class CollectionResolver:
+    """Resolve the live collection through the alias, re-reading it when the pointer file changes."""
+
+    def __init__(self, chroma_client, chroma_dir: Path, embedding_function=None):
+        self.chroma_client = chroma_client
+        self.chroma_dir = Path(chroma_dir)
+        self.embedding_function = embedding_function
+        self._alias_mtime: Optional[int] = None
+        self._collection = None
+        self._faq_collection = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the active collection, or None if there isn't one."""
+        if self.chroma_client is None:
+            return None
+        try:
+            mtime = (self.chroma_dir / ALIAS_FILE).stat().st_mtime_ns
+        except OSError:
+            mtime = 0
+        with self._lock:
+            if self._collection is not None and mtime == self._alias_mtime:
+                return self._collection
+            name = read_active(self.chroma_dir) or ALIAS_NAME
+            try:
+                if self.embedding_function is not None:
+                    collection = self.chroma_client.get_collection(name, embedding_function=self.embedding_function)
+                else:
+                    collection = self.chroma_client.get_collection(name)
+                print(f"Using collection {name} with {collection.count()} documents")
+            except ValueError as e:
+                print(f"Error getting collection {name}: {e}")
+                print("This likely means process_docs.py hasn't been run or the persistence failed.")
+                # Keep serving the previous collection if the new one can't be opened
+                return self._collection
+            self._collection = collection
+            self._faq_collection = self._open_faq(name)
+            self._alias_mtime = mtime
+            return collection
+
+    def _open_faq(self, name: str):
+        try:
+            if self.embedding_function is not None:
+                return self.chroma_client.get_collection(faq_collection_name(name), embedding_function=self.embedding_function)
+            return self.chroma_client.get_collection(faq_collection_name(name))
+        except ValueError:
+            # Collections built before the FAQ index existed have no companion
+            return None
+
+    def get_faq(self):
+        """Return the FAQ collection belonging to the active collection, or None if it has none."""
+        self.get()
+        return self._faq_collection
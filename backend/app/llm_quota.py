@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Set
+
+from . import metrics
+
+# Fraction of the bucket each call type must leave untouched. Answers may use
+# the whole quota; follow-up questions and LLM ranking, which have cheap local
+# fallbacks, are the first to be shed once the bucket runs low.
+DEFAULT_RESERVES: Dict[str, float] = {
+    "answer": 0.0,
+    "classify": 0.2,
+    "rank": 0.5,
+    "follow_up": 0.5,
+    "prewarm": 0.7,
+}
+
+# Call types shed while running the current pipeline. Pipelines set a fresh
+# set; BoundedExecutor.run copies the context into its worker threads, so
+# sheds on any stage are recorded in the caller's set.
+shed_calls: ContextVar[Optional[Set[str]]] = ContextVar("shed_calls", default=None)
+
+# Background work such as cache prewarming sets its own call type here, so all
+# of its LLM calls are admitted under that type's reserve instead of the
+# per-stage ones and cannot use up the quota live requests need.
+quota_call_type: ContextVar[Optional[str]] = ContextVar("quota_call_type", default=None)
+
+class QuotaExceeded(Exception):
+    """Raised when an LLM call is shed to protect quota for higher-priority calls."""
+
+class TokenBucket:
+    """Classic token bucket: capacity tokens, refilled continuously at rate per second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def can_take(self, amount: float, reserve: float) -> bool:
+        return self.tokens - amount >= reserve * self.capacity
+
+class LLMQuotaScheduler:
+    """Priority-aware admission for Gemini calls against requests- and tokens-per-minute quotas.
+
+    Each call takes one request from the request bucket and its estimated
+    prompt tokens from the token bucket. A call is admitted only if, after
+    taking them, at least its call type's reserve fraction of each bucket is
+    left, so low-priority calls are shed while high-priority ones still get
+    through. A 429 from the API empties the buckets, which makes the next
+    calls shed (to their local fallbacks) instead of hitting the API again.
+
+    A limit of 0 disables that bucket.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float = 0, burst_seconds: float = 60,
+                 reserves: Optional[Dict[str, float]] = None):
+        self.buckets: Dict[str, TokenBucket] = {}
+        if requests_per_minute > 0:
+            self.buckets["requests"] = TokenBucket(requests_per_minute / 60, requests_per_minute * burst_seconds / 60)
+        if tokens_per_minute > 0:
+            self.buckets["tokens"] = TokenBucket(tokens_per_minute / 60, tokens_per_minute * burst_seconds / 60)
+        self.reserves = dict(DEFAULT_RESERVES, **(reserves or {}))
+        self._lock = threading.Lock()
+        for name in self.buckets:
+            metrics.register_gauge(f"llm_quota.{name}_available", lambda name=name: self.available(name))
+
+    def available(self, bucket: str) -> float:
+        with self._lock:
+            self.buckets[bucket].refill()
+            return round(self.buckets[bucket].tokens, 2)
+
+    def acquire(self, call_type: str, prompt_tokens: int = 0) -> None:
+        """Take quota for one call, or raise QuotaExceeded if it would eat into a higher priority's reserve."""
+        call_type = quota_call_type.get() or call_type
+        reserve = self.reserves.get(call_type, 0.0)
+        amounts = {"requests": 1, "tokens": prompt_tokens}
+        with self._lock:
+            for bucket in self.buckets.values():
+                bucket.refill()
+            if not all(bucket.can_take(amounts[name], reserve) for name, bucket in self.buckets.items()):
+                metrics.increment(f"llm_quota.{call_type}.shed")
+                raise QuotaExceeded(f"LLM quota too low for {call_type} calls")
+            for name, bucket in self.buckets.items():
+                bucket.tokens -= amounts[name]
+        metrics.increment(f"llm_quota.{call_type}.admitted")
+        metrics.increment("llm_quota.tokens_used", prompt_tokens)
+
+    def rate_limited(self) -> None:
+        """Record a 429 from the API; drain the buckets so only reserved capacity refills first."""
+        metrics.increment("llm_quota.rate_limited")
+        with self._lock:
+            for bucket in self.buckets.values():
+                bucket.refill()
+                bucket.tokens = 0.0
+
+    def call(self, call_type: str, prompt_tokens: int, fn: Callable[[], str],
+             is_rate_limit: Callable[[Exception], bool] = lambda e: False) -> str:
+        """Run fn under the quota, draining the buckets if it fails with a rate-limit error."""
+        self.acquire(call_type, prompt_tokens)
+        try:
+            return fn()
+        except Exception as e:
+            if is_rate_limit(e):
+                self.rate_limited()
+            raise
+
+def record_shed(call_type: str) -> None:
+    """Note a shed call in the current pipeline's shed_calls set, if one is being tracked."""
+    calls = shed_calls.get()
+    if calls is not None:
+        calls.add(call_type)
+
+def create_quota_scheduler() -> LLMQuotaScheduler:
+    """Build the scheduler from LLM_QUOTA_* environment variables.
+
+    LLM_QUOTA_RPM / LLM_QUOTA_TPM default to gemini-1.5-flash free-tier limits;
+    LLM_QUOTA_RESERVE_<TYPE> overrides a call type's reserve fraction.
+    """
+    reserves = {
+        call_type: float(os.getenv(f"LLM_QUOTA_RESERVE_{call_type.upper()}", default))
+        for call_type, default in DEFAULT_RESERVES.items()
+    }
+    return LLMQuotaScheduler(
+        requests_per_minute=float(os.getenv("LLM_QUOTA_RPM", "15")),
+        tokens_per_minute=float(os.getenv("LLM_QUOTA_TPM", "1000000")),
+        burst_seconds=float(os.getenv("LLM_QUOTA_BURST_SECONDS", "60")),
+        reserves=reserves,
+    )
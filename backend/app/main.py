@@ -1,20 +1,46 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Tuple, Callable
 import pandas as pd
 from pathlib import Path
 import chromadb
 from chromadb.config import Settings
 import google.generativeai as genai
+from google.api_core.exceptions import ResourceExhausted
 import os
 from dotenv import load_dotenv
 import time
+import threading
+import asyncio
+import json
 import uuid
 from datetime import datetime
 import uuid
 from datetime import datetime
 
+from . import metrics
+from .prompt_budget import PromptBuilder, format_user_profile, estimate_tokens, record_sent
+from .response_cache import ResponseCache, normalize_query, preference_signature, parse_preference_signature
+from .singleflight import SingleFlight
+from .embedding_ranker import ProductEmbeddingIndex, RankingFeatures
+from .index_alias import CollectionResolver
+from .embedding_service import create_embedding_service
+from .query_log import QueryLog, StageTimer
+from .cooccurrence import CooccurrenceIndex
+from .executors import BoundedExecutor, ExecutorSaturated
+from .shared_catalog import ProductView, SharedCatalog, attach_or_build
+from .profiler import SamplingProfiler, current_profile, profile_name
+from .faq_index import find_faq_answer, format_faq_answer
+from .retrieval import RetrievalHit, hits_from_query_result, hit_documents, retrieved_product_ids, retrieval_rank_scores
+from .llm_quota import QuotaExceeded, create_quota_scheduler, quota_call_type, record_shed, shed_calls
+from .preference_bonus import (
+    SKIN_TYPE_TERMS, CONCERN_TERMS, SKIN_TYPE_BONUS, CONCERN_BONUS, build_bonus_columns, build_bonus_table,
+    lookup_bonus, preference_keys,
+)
+
 load_dotenv()
 
 # Initialize FastAPI app
@@ -32,6 +58,54 @@ app.add_middleware(
 # Session storage (in production, use Redis or database)
 sessions: Dict[str, Dict] = {}
 
+# Blocking work is kept off the event loop on two bounded pools: CPU-bound
+# embedding/retrieval/catalog work and I/O-bound Gemini calls. When their
+# queues fill up, /search fails fast with 503 instead of piling up latency.
+cpu_executor = BoundedExecutor(
+    "cpu",
+    max_workers=int(os.getenv("CPU_EXECUTOR_WORKERS", str(os.cpu_count() or 2))),
+    max_queue=int(os.getenv("CPU_EXECUTOR_QUEUE", "64")),
+)
+llm_executor = BoundedExecutor(
+    "llm",
+    max_workers=int(os.getenv("LLM_EXECUTOR_WORKERS", "32")),
+    max_queue=int(os.getenv("LLM_EXECUTOR_QUEUE", "256")),
+)
+MAX_INFLIGHT_REQUESTS = int(os.getenv("MAX_INFLIGHT_REQUESTS", "256"))
+inflight_requests = 0
+metrics.register_gauge("search.inflight", lambda: inflight_requests)
+
+# Cache of /search results keyed by (normalized query, preference signature, data version).
+# Entries always hold the history-independent stages (classification, FAQ match,
+# retrieval; see QUERY_STAGE_KEYS); entries computed without conversation
+# history ("history_free") also hold the whole result. Turns with history reuse
+# the stages and regenerate the answer, ranking and follow-up.
+QUERY_STAGE_KEYS = ("query_type", "faq_match", "hits", "context")
+search_cache = ResponseCache(
+    max_entries=int(os.getenv("SEARCH_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "300")),
+    stale_ttl=float(os.getenv("SEARCH_CACHE_STALE_TTL", "3600")),
+    name="search_cache",
+)
+
+# Compact record of every /search request, written off the request path.
+# Its most popular queries are used to prewarm search_cache at startup.
+query_log = QueryLog(
+    Path(os.getenv("QUERY_LOG_PATH", "data/query_log.jsonl")),
+    max_bytes=int(os.getenv("QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+    backup_count=int(os.getenv("QUERY_LOG_BACKUPS", "3")),
+)
+PREWARM_TOP_N = int(os.getenv("PREWARM_TOP_N", "50"))
+prewarm_done = threading.Event()
+
+# Products shown together in a turn, used for "frequently shown together" and
+# as a ranking signal on follow-up turns. Snapshotted to disk in the background.
+COOCCURRENCE_PATH = Path(os.getenv("COOCCURRENCE_PATH", "data/cooccurrence.json"))
+COOCCURRENCE_WEIGHT = float(os.getenv("COOCCURRENCE_WEIGHT", "1.0"))
+cooccurrence = CooccurrenceIndex()
+cooccurrence.load(COOCCURRENCE_PATH)
+cooccurrence.start_autosave(COOCCURRENCE_PATH, interval=float(os.getenv("COOCCURRENCE_SNAPSHOT_INTERVAL", "60")))
+
 # Initialize Gemini
 try:
     genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
@@ -41,6 +115,10 @@ except Exception as e:
     print(f"Error initializing Gemini: {e}")
     model = None
 
+# Embedding model shared by retrieval and semantic ranking; loaded and warmed
+# here so the first query doesn't pay for it
+embedding_service = create_embedding_service()
+
 try:
     base_dir = Path(__file__).parent.parent
     chroma_dir = base_dir / "data" / "chroma_db"
@@ -52,34 +130,151 @@ try:
     
     time.sleep(5)
 
-    # Get the collection
-    try:
-        collection = chroma_client.get_collection("skincare_docs")
-        print(f"Found collection with {collection.count()} documents")
-    except ValueError as e:
-        print(f"Error getting collection: {e}")
-        print("This likely means process_docs.py hasn't been run or the persistence failed.")
-        collection = None # Explicitly set collection to None if not found
+    # Resolve the live collection through the alias written by process_docs.py.
+    # It is re-resolved whenever a reindex switches the alias.
+    collection_resolver = CollectionResolver(chroma_client, chroma_dir, embedding_function=embedding_service)
+    collection_resolver.get()
 
 except Exception as e:
     print(f"Error initializing ChromaDB client: {e}")
     chroma_client = None
-    collection = None
+    collection_resolver = CollectionResolver(None, Path("."))
+
+def get_collection():
+    """Get the currently active document collection (None if unavailable)."""
+    return collection_resolver.get()
+
+# QUESTION queries matching a customer-ticket FAQ entry this closely are
+# answered from the ticket without an LLM call
+FAQ_ANSWERS = os.getenv("FAQ_ANSWERS", "1").lower() in ("1", "true", "yes")
+FAQ_MIN_SIMILARITY = float(os.getenv("FAQ_MIN_SIMILARITY", "0.8"))
+FAQ_MIN_TERM_OVERLAP = float(os.getenv("FAQ_MIN_TERM_OVERLAP", "0.6"))
+
+# Documents retrieved as context per query; tune together with HNSW_SEARCH_EF
+RETRIEVAL_N_RESULTS = int(os.getenv("RETRIEVAL_N_RESULTS", "3"))
+# Ranking bonus for products whose catalog documents were retrieved for the
+# query, scaled by retrieval rank (1 for the best hit, 1/2 for the second, ...)
+RETRIEVAL_RANK_BOOST = float(os.getenv("RETRIEVAL_RANK_BOOST", "1.0"))
+
+# "semantic" ranks by embedding similarity in-process; "llm" asks Gemini to rank
+RANKING_MODE = os.getenv("RANKING_MODE", "semantic").lower()
+SEMANTIC_RANK_WEIGHT = float(os.getenv("SEMANTIC_RANK_WEIGHT", "5.0"))
+# Products the local ranker shortlists for the LLM ranking prompt
+RANK_PROMPT_CANDIDATES = int(os.getenv("RANK_PROMPT_CANDIDATES", "20"))
+
+# Product embeddings from the collection, kept in memory for semantic ranking.
+# Queries are embedded by embedding_service, the model the collection was built with.
+product_index = ProductEmbeddingIndex()
+
+# One coalescing group per pipeline stage, so concurrent identical prompts or
+# retrieval queries share one in-flight call and coalesce counts are per stage
+flights: Dict[str, SingleFlight] = {
+    stage: SingleFlight(stage) for stage in ("classify", "answer", "rank", "follow_up", "retrieval")
+}
+
+# Token-bucket admission for Gemini calls; low-priority call types are shed
+# to their local fallbacks before the rate limit is hit
+llm_quota = create_quota_scheduler()
+
+def generate_text(call_type: str, prompt: str) -> str:
+    """Send a prompt to Gemini and return the response text, sharing identical in-flight calls.
+
+    Raises QuotaExceeded when the quota scheduler sheds the call.
+    """
+    def send():
+        record_sent(call_type, prompt)
+        return model.generate_content(prompt).text
+
+    try:
+        return flights[call_type].do(prompt, lambda: llm_quota.call(
+            call_type, estimate_tokens(prompt), send, is_rate_limit=lambda e: isinstance(e, ResourceExhausted)))
+    except QuotaExceeded:
+        record_shed(call_type)
+        raise
+
+# Per-product preference bonus vectors, rebuilt whenever the catalog is (re)loaded.
+# Shared catalogs keep their bonuses as derived columns in the catalog file instead.
+preference_bonus_table: Dict[str, Dict[str, float]] = {}
+_catalog_cache: Dict[str, Any] = {"mtime": None, "records": []}
+
+# With several worker processes, the catalog is written once to a memory-mapped
+# columnar file and every worker attaches it read-only instead of holding its own copy
+SHARED_CATALOG = os.getenv("SHARED_CATALOG", "1").lower() in ("1", "true", "yes")
+SHARED_CATALOG_DIR = Path(os.getenv("SHARED_CATALOG_DIR", "data/catalog_cache"))
+
+def read_catalog_records(catalog_path: Path) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Parse the catalog Excel file into records and the list of column names."""
+    df = pd.read_excel(catalog_path)
+    
+    df['price (USD)'] = pd.to_numeric(df['price (USD)'], errors='coerce')
+
+    return df.to_dict('records'), list(df.columns)
+
+MARGIN_BONUS_COLUMN = "margin_bonus"
+BONUS_COLUMN_PREFIX = "bonus:"
+
+def catalog_ranking_columns(records) -> Dict[str, List[float]]:
+    """Per-product ranking bonuses in catalog order: the margin bonus and one column per preference key.
+
+    Written into the shared catalog file, so every worker maps the same copy
+    (see SharedCatalog.derived).
+    """
+    columns = {BONUS_COLUMN_PREFIX + key: column for key, column in build_bonus_columns(records).items()}
+    # NaN margins earn no bonus
+    columns[MARGIN_BONUS_COLUMN] = [bonus if bonus == bonus else 0.0 for bonus in map(margin_bonus, records)]
+    return columns
 
 # Load product catalog
 def load_catalog():
+    """Load the catalog records, re-parsing the Excel file only when it changes.
+
+    The returned records are shared between requests and must not be mutated.
+    With SHARED_CATALOG enabled they are read-only ProductView mappings backed
+    by the shared file.
+    """
+    global preference_bonus_table
     try:
-        df = pd.read_excel("data/skincare catalog.xlsx")
-        
-        df['price (USD)'] = pd.to_numeric(df['price (USD)'], errors='coerce')
+        catalog_path = Path("data/skincare catalog.xlsx")
+        mtime = (str(catalog_path.resolve()), catalog_path.stat().st_mtime_ns)
+        if _catalog_cache["mtime"] == mtime:
+            return _catalog_cache["records"]
 
-        records = df.to_dict('records')
+        if SHARED_CATALOG:
+            records = attach_or_build(lambda: read_catalog_records(catalog_path), catalog_path, SHARED_CATALOG_DIR,
+                                      derive=catalog_ranking_columns)
+            preference_bonus_table = {}
+        else:
+            records, _ = read_catalog_records(catalog_path)
+            preference_bonus_table = build_bonus_table(records)
+        _catalog_cache.update(mtime=mtime, records=records)
         
         return records
     except Exception as e:
         print(f"Error loading catalog: {e}")
         return []
 
+def product_lookup(products) -> Callable[[str], Optional[Dict[str, Any]]]:
+    """Return a product_id -> product lookup; the shared catalog answers from its own index without copying."""
+    if isinstance(products, SharedCatalog):
+        return products.by_id
+    return {str(p.get('product_id')): p for p in products}.get
+
+def get_data_version() -> str:
+    """Identify the current catalog file and index contents so cached results expire when either changes."""
+    try:
+        catalog_mtime = Path("data/skincare catalog.xlsx").stat().st_mtime_ns
+    except OSError:
+        catalog_mtime = 0
+    collection = get_collection()
+    try:
+        index_version = f"{collection.name}:{collection.count()}" if collection else "none"
+    except Exception:
+        index_version = "none"
+    return f"{catalog_mtime}:{index_version}"
+
+# Load product embeddings at startup; later reindexes change the data version and trigger a reload
+product_index.ensure_loaded(get_collection(), get_data_version())
+
 # Enhanced Models
 class ConversationTurn(BaseModel):
     query: str
@@ -152,6 +347,7 @@ def add_to_conversation_history(session_id: str, query: str, query_type: str, an
             "products_shown": products
         }
         sessions[session_id]["conversation_history"].append(conversation_turn)
+        cooccurrence.add_products(products)
         
         # Keep only last 10 conversations to prevent memory issues
         if len(sessions[session_id]["conversation_history"]) > 10:
@@ -210,8 +406,14 @@ def extract_user_preferences(session_id: str, query: str):
     
     print(f"Updated preferences for session {session_id}: {preferences}")
 
-def get_relevant_context(query: str, n_results: int = 3) -> List[str]:
-    """Get relevant context from the document store."""
+def retrieve(query: str, n_results: Optional[int] = None) -> List[RetrievalHit]:
+    """Retrieve documents for a query with their distances and metadata (RETRIEVAL_N_RESULTS by default).
+
+    Catalog hits carry product_id and the product fields stored at ingestion,
+    so later stages use them directly instead of parsing document text.
+    """
+    n_results = n_results or RETRIEVAL_N_RESULTS
+    collection = get_collection()
     if not chroma_client or not collection:
         print("ChromaDB client or collection not initialized")
         return []
@@ -221,25 +423,28 @@ def get_relevant_context(query: str, n_results: int = 3) -> List[str]:
             print("Collection is empty, no context available")
             return []
             
-        results = collection.query(
+        results = flights["retrieval"].do((collection.name, query, n_results), lambda: collection.query(
             query_texts=[query],
-            n_results=n_results
-        )
-        documents = results.get('documents', [[]])[0] # Safely access documents
-        print(f"Retrieved {len(documents)} context documents.")
-        # Add source information if available in the results, maybe embed it in the text or return separately
-        # For now, just return the text content
-        return documents
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"]
+        ))
+        hits = hits_from_query_result(results)
+        print(f"Retrieved {len(hits)} context documents.")
+        return hits
     except Exception as e:
         print(f"Error getting context: {e}")
         return []
 
+def match_faq(query: str) -> Optional[Dict[str, Any]]:
+    """Find a customer-ticket FAQ entry that already answers the query, if any."""
+    return find_faq_answer(collection_resolver.get_faq(), query, FAQ_MIN_SIMILARITY, FAQ_MIN_TERM_OVERLAP)
+
 def classify_query(query: str) -> str:
     """Classify query as 'QUESTION' or 'RECOMMENDATION' with improved logic."""
     print(f"\n=== Classifying Query: '{query}' ===")
     if model:
         try:
-            prompt = f"""
+            prompt = PromptBuilder("classify").add("instructions", """
             Classify the following user query as either 'QUESTION' or 'RECOMMENDATION'.
             
             QUESTION: User is asking for information, explanations, comparisons, or general knowledge
@@ -249,11 +454,11 @@ def classify_query(query: str) -> str:
             Examples: "I need something for dry skin", "Recommend products for acne", "What should I use for anti-aging?"
             
             Respond with only the word 'QUESTION' or 'RECOMMENDATION'.
-
+""", required=True).add("query", f"""
             Query: "{query}"
-            """
-            response = model.generate_content(prompt)
-            classification = response.text.strip().upper()
+            """, priority=0).build()
+            response_text = generate_text("classify", prompt)
+            classification = response_text.strip().upper()
             if classification in ['QUESTION', 'RECOMMENDATION']:
                 print(f"LLM Classification: {classification}")
                 return classification
@@ -299,34 +504,26 @@ def classify_query(query: str) -> str:
         print("Keyword Classification: Defaulting to RECOMMENDATION")
         return "RECOMMENDATION"
 
-def generate_fallback_answer(query: str, context: List[str], user_preferences: Dict[str, Any] = {}) -> str:
-    """Generate a helpful answer without using LLM based on context and query analysis."""
-    if not context:
+def generate_fallback_answer(query: str, hits: List[RetrievalHit], user_preferences: Dict[str, Any] = {}) -> str:
+    """Generate a helpful answer without using LLM based on retrieved products and query analysis."""
+    if not hits:
         return f"I couldn't find specific information related to \"{query}\" in my knowledge base. However, I've found some relevant products below that might help!"
     
     query_lower = query.lower()
     
-    # Extract useful information from context
-    products_mentioned = []
+    # Use the product fields stored with catalog hits
     categories_found = set()
-    ingredients_found = set()
-    
-    for ctx in context:
-        if "Product:" in ctx:
-            # Extract product name
-            lines = ctx.strip().split('\n')
-            for line in lines:
-                if line.strip().startswith("Product:"):
-                    product_name = line.replace("Product:", "").strip()
-                    products_mentioned.append(product_name)
-                elif line.strip().startswith("Category:"):
-                    category = line.replace("Category:", "").strip()
-                    categories_found.add(category)
-                elif line.strip().startswith("Ingredients:"):
-                    ingredients = line.replace("Ingredients:", "").strip()
-                    # Split ingredients by semicolon or comma
-                    for ingredient in ingredients.replace(';', ',').split(','):
-                        ingredients_found.add(ingredient.strip())
+    ingredients_found = []
+    
+    for hit in hits:
+        if hit["source"] != "catalog":
+            continue
+        if hit["fields"].get("category"):
+            categories_found.add(hit["fields"]["category"])
+        # Split ingredients by semicolon or comma, keeping retrieval order
+        for ingredient in hit["fields"].get("top_ingredients", "").replace(';', ',').split(','):
+            if ingredient.strip() and ingredient.strip() not in ingredients_found:
+                ingredients_found.append(ingredient.strip())
     
     # Build a contextual response
     response_parts = []
@@ -362,7 +559,7 @@ def generate_fallback_answer(query: str, context: List[str], user_preferences: D
     
     # Add ingredient highlights if found
     if ingredients_found:
-        key_ingredients = list(ingredients_found)[:3]  # Top 3 ingredients
+        key_ingredients = ingredients_found[:3]  # Top 3 ingredients
         response_parts.append(f"These products feature ingredients like {', '.join(key_ingredients)}.")
     
     # Add category information
@@ -377,34 +574,16 @@ def generate_fallback_answer(query: str, context: List[str], user_preferences: D
     else:
         return "I found some products that match your search. Take a look at the recommendations below!"
 
-def generate_answer(query: str, context: List[str], conversation_context: str = "", user_preferences: Dict[str, Any] = {}) -> str:
-    """Generate an answer based on the query, context, and conversation history."""
-    print(f"\n=== Generating Answer ===")
-    if not model:
-        print("LLM model not available, using fallback answer generation.")
-        return generate_fallback_answer(query, context, user_preferences)
+def build_answer_prompt(query: str, context: List[str], conversation_context: str = "", user_preferences: Dict[str, Any] = {}) -> str:
+    """Build the answer-generation prompt."""
+    # Build enhanced prompt with conversation context and preferences.
+    # Priorities decide what survives when the budget is tight:
+    # query > retrieved context > user profile > conversation history.
+    profile = format_user_profile(user_preferences)
     
-    if not context:
-        print("No context available for answer generation.")
-        return f"I couldn't find specific information related to \"{query}\" in my knowledge base."
-
-    try:
-        # Build enhanced prompt with conversation context and preferences
-        preference_context = ""
-        if user_preferences:
-            prefs = []
-            if 'skin_type' in user_preferences:
-                prefs.append(f"Skin type: {user_preferences['skin_type']}")
-            if 'concerns' in user_preferences:
-                prefs.append(f"Concerns: {', '.join(user_preferences['concerns'])}")
-            if prefs:
-                preference_context = f"\nUser Profile: {' | '.join(prefs)}"
-        
-        conv_context = ""
-        if conversation_context:
-            conv_context = f"\nConversation History: {conversation_context}"
-        
-        prompt = f"""
+    return (
+        PromptBuilder("answer")
+        .add("instructions", """
         You are a skincare expert and personal shopper. Answer the following query based on the provided context.
         Be specific, helpful, and provide detailed information with citations.
         
@@ -417,73 +596,134 @@ def generate_answer(query: str, context: List[str], conversation_context: str =
         - Keep responses concise but informative (2-3 sentences max)
         - If the context doesn't contain enough information, be honest about limitations
 
-        Query: "{query}"{preference_context}{conv_context}
-
-        Context:
-        {chr(10).join([f'Source {i+1}: {text}' for i, text in enumerate(context)])}
+""", required=True)
+        .add("query", f'        Query: "{query}"', priority=0)
+        .add("profile", f"\nUser Profile: {profile}" if profile else "", priority=2)
+        .add("history", f"\nConversation History: {conversation_context}" if conversation_context else "", priority=3)
+        .add_items("context", context, priority=1, prefix="\n\n        Context:\n        ",
+                   item_format=lambda i, text: f"Source {i+1}: {text}")
+        .add("footer", """
 
         Answer (be conversational and cite sources naturally):
-        """
+        """, required=True)
+        .build()
+    )
+
+def generate_answer(query: str, hits: List[RetrievalHit], conversation_context: str = "", user_preferences: Dict[str, Any] = {}) -> str:
+    """Generate an answer based on the query, retrieved documents, and conversation history."""
+    print(f"\n=== Generating Answer ===")
+    if not model:
+        print("LLM model not available, using fallback answer generation.")
+        return generate_fallback_answer(query, hits, user_preferences)
+    
+    if not hits:
+        print("No context available for answer generation.")
+        return f"I couldn't find specific information related to \"{query}\" in my knowledge base."
+
+    try:
+        prompt = build_answer_prompt(query, hit_documents(hits), conversation_context, user_preferences)
         
-        response = model.generate_content(prompt)
-        answer_text = response.text.strip()
+        response_text = generate_text("answer", prompt)
+        answer_text = response_text.strip()
         print("Answer generated successfully.")
         return answer_text
+    except QuotaExceeded as e:
+        print(f"{e}, using fallback answer generation.")
+        return generate_fallback_answer(query, hits, user_preferences)
     except Exception as e:
         print(f"Error generating answer with LLM: {e}")
         return "I am sorry, I encountered an error while trying to answer your question."
 
+def stream_answer(query: str, hits: List[RetrievalHit], conversation_context: str = "", user_preferences: Dict[str, Any] = {},
+                  emit: Callable[[str], None] = print) -> str:
+    """Like generate_answer, but streams the answer from Gemini, calling emit with each text chunk.
+
+    Fallback answers are emitted as a single chunk. Returns the full answer.
+    Streamed calls are not coalesced, but they do go through the quota scheduler.
+    """
+    print(f"\n=== Streaming Answer ===")
+    if not model or not hits:
+        answer_text = generate_answer(query, hits, conversation_context, user_preferences)
+        emit(answer_text)
+        return answer_text
+
+    prompt = build_answer_prompt(query, hit_documents(hits), conversation_context, user_preferences)
+    try:
+        llm_quota.acquire("answer", estimate_tokens(prompt))
+    except QuotaExceeded as e:
+        record_shed("answer")
+        print(f"{e}, using fallback answer generation.")
+        answer_text = generate_fallback_answer(query, hits, user_preferences)
+        emit(answer_text)
+        return answer_text
+
+    record_sent("answer", prompt)
+    chunks = []
+    try:
+        for chunk in model.generate_content(prompt, stream=True):
+            chunks.append(chunk.text)
+            emit(chunk.text)
+    except Exception as e:
+        if isinstance(e, ResourceExhausted):
+            llm_quota.rate_limited()
+        print(f"Error streaming answer with LLM: {e}")
+        if not chunks:
+            answer_text = "I am sorry, I encountered an error while trying to answer your question."
+            emit(answer_text)
+            return answer_text
+    print("Answer streamed successfully.")
+    return "".join(chunks).strip()
+
+def generate_fallback_follow_up(query: str, user_preferences: Dict[str, Any] = {}) -> str:
+    """Pick a follow-up question from the query keywords and known preferences, without the LLM."""
+    # Enhanced fallback questions based on query content and preferences
+    query_lower = query.lower()
+    
+    # If we know user's skin type, ask about specific concerns
+    if user_preferences.get('skin_type'):
+        skin_type = user_preferences['skin_type']
+        if skin_type == 'dry':
+            return "Are you looking for hydrating serums or rich moisturizers for your dry skin?"
+        elif skin_type == 'oily':
+            return "Would you prefer lightweight, oil-free formulas for your oily skin?"
+        elif skin_type == 'sensitive':
+            return "Are you looking for fragrance-free, gentle formulations?"
+    
+    # Default fallbacks based on query
+    if any(word in query_lower for word in ['serum', 'serums']):
+        return "What specific skin concerns are you targeting with serums - hydration, brightening, or anti-aging?"
+    elif any(word in query_lower for word in ['moisturizer', 'cream', 'lotion']):
+        return "What's your skin type? (dry, oily, combination, or sensitive)"
+    elif any(word in query_lower for word in ['acne', 'pimple', 'breakout']):
+        return "How would you describe your acne - occasional breakouts or persistent issues?"
+    elif any(word in query_lower for word in ['anti-aging', 'wrinkle', 'fine line']):
+        return "What's your primary aging concern - fine lines, firmness, or dark spots?"
+    else:
+        return "What's your main skin concern right now?"
+
 def generate_follow_up_question(query: str, context: List[str], user_preferences: Dict[str, Any] = {}, conversation_context: str = "") -> str:
     """Generate a smart follow-up question based on the query, context, and user history."""
     print(f"\n=== Generating Follow-up Question ===")
     if not model:
-        # Enhanced fallback questions based on query content and preferences
-        query_lower = query.lower()
-        
-        # If we know user's skin type, ask about specific concerns
-        if user_preferences.get('skin_type'):
-            skin_type = user_preferences['skin_type']
-            if skin_type == 'dry':
-                return "Are you looking for hydrating serums or rich moisturizers for your dry skin?"
-            elif skin_type == 'oily':
-                return "Would you prefer lightweight, oil-free formulas for your oily skin?"
-            elif skin_type == 'sensitive':
-                return "Are you looking for fragrance-free, gentle formulations?"
-        
-        # Default fallbacks based on query
-        if any(word in query_lower for word in ['serum', 'serums']):
-            return "What specific skin concerns are you targeting with serums - hydration, brightening, or anti-aging?"
-        elif any(word in query_lower for word in ['moisturizer', 'cream', 'lotion']):
-            return "What's your skin type? (dry, oily, combination, or sensitive)"
-        elif any(word in query_lower for word in ['acne', 'pimple', 'breakout']):
-            return "How would you describe your acne - occasional breakouts or persistent issues?"
-        elif any(word in query_lower for word in ['anti-aging', 'wrinkle', 'fine line']):
-            return "What's your primary aging concern - fine lines, firmness, or dark spots?"
-        else:
-            return "What's your main skin concern right now?"
+        return generate_fallback_follow_up(query, user_preferences)
 
     try:
         # Build context for follow-up generation
-        pref_context = ""
-        if user_preferences:
-            known_info = []
-            if 'skin_type' in user_preferences:
-                known_info.append(f"skin type: {user_preferences['skin_type']}")
-            if 'concerns' in user_preferences:
-                known_info.append(f"concerns: {', '.join(user_preferences['concerns'])}")
-            if known_info:
-                pref_context = f" (We know: {', '.join(known_info)})"
-
-        conv_context_str = ""
-        if conversation_context:
-            conv_context_str = f"\nPrevious conversation: {conversation_context}"
-
-        prompt = f"""
+        known_info = format_user_profile(user_preferences, separator=", ", lowercase=True)
+
+        prompt = (
+            PromptBuilder("follow_up")
+            .add("instructions", """
         Generate ONE smart follow-up question to help narrow down the user's skincare needs.
         Make it specific, actionable, and conversational.
         
-        Query: "{query}"{pref_context}
-        Available context: {context[:2] if context else "No specific context"}{conv_context_str}
+""", required=True)
+            .add("query", f'        Query: "{query}"', priority=0)
+            .add("profile", f" (We know: {known_info})" if known_info else "", priority=1)
+            .add_items("context", context[:2] if context else ["No specific context"], priority=2,
+                       prefix="\n        Available context: ", separator="\n")
+            .add("history", f"\nPrevious conversation: {conversation_context}" if conversation_context else "", priority=3)
+            .add("guidelines", """
         
         Guidelines:
         - Don't ask about information we already know about the user
@@ -500,19 +740,75 @@ def generate_follow_up_question(query: str, context: List[str], user_preferences
         - "What specific results are you hoping to see?"
         
         Generate one follow-up question:
-        """
+        """, required=True)
+            .build()
+        )
         
-        response = model.generate_content(prompt)
-        follow_up_text = response.text.strip()
+        response_text = generate_text("follow_up", prompt)
+        follow_up_text = response_text.strip()
         # Clean up the response
         if follow_up_text.startswith('"') and follow_up_text.endswith('"'):
             follow_up_text = follow_up_text[1:-1]
         print("Follow-up question generated successfully.")
         return follow_up_text
+    except QuotaExceeded as e:
+        print(f"{e}, using fallback follow-up question.")
+        return generate_fallback_follow_up(query, user_preferences)
     except Exception as e:
         print(f"Error generating follow-up question: {e}")
         return "What specific skin concerns are you targeting?"
 
+def calculate_preference_bonus(product: Dict[str, Any], user_preferences: Dict[str, Any] = {}) -> float:
+    """Bonus for products whose tags match the user's skin type and concerns."""
+    score = 0.0
+    if user_preferences:
+        # Skin type preference bonus
+        if 'skin_type' in user_preferences:
+            skin_type = user_preferences['skin_type']
+            tags_lower = product.get('tags', '').lower()
+            if skin_type in SKIN_TYPE_TERMS and any(term in tags_lower for term in SKIN_TYPE_TERMS[skin_type]):
+                score += SKIN_TYPE_BONUS
+                print(f"Skin type bonus ({skin_type}): {product.get('name', 'Unknown Product')}")
+        
+        # Concern-based bonus
+        if 'concerns' in user_preferences:
+            concerns = user_preferences['concerns']
+            tags_lower = product.get('tags', '').lower()
+            for concern in concerns:
+                if concern in CONCERN_TERMS and any(term in tags_lower for term in CONCERN_TERMS[concern]):
+                    score += CONCERN_BONUS
+    return score
+
+def get_preference_bonus(product: Dict[str, Any], user_preferences: Dict[str, Any] = {}) -> float:
+    """Preference bonus from the table precomputed at catalog load (computed on the fly if missing).
+
+    Shared catalog rows read it from the catalog file's derived columns.
+    """
+    if isinstance(product, ProductView):
+        derived = product.catalog.derived
+        columns = [BONUS_COLUMN_PREFIX + key for key in preference_keys(user_preferences)]
+        return sum(float(derived[column][product.row]) for column in columns if column in derived)
+    vector = preference_bonus_table.get(str(product.get('product_id')))
+    if vector is None:
+        return calculate_preference_bonus(product, user_preferences)
+    return lookup_bonus(vector, user_preferences)
+
+def margin_bonus(product: Dict[str, Any]) -> float:
+    """Business bonus based on product margin (0.1 to 0.5 points), without logging."""
+    if 'margin (%)' in product and isinstance(product['margin (%)'], (int, float)):
+        return min(product['margin (%)'] * 0.01, 0.5)  # Cap at 0.5 points
+    return 0.0
+
+def calculate_margin_bonus(product: Dict[str, Any]) -> float:
+    """Business bonus based on product margin (0.1 to 0.5 points)."""
+    if 'margin (%)' in product and isinstance(product['margin (%)'], (int, float)):
+        margin_score = margin_bonus(product)
+        print(f"Margin bonus (+{margin_score:.2f}): {product.get('name', 'Unknown Product')}")
+        return margin_score
+    else:
+        print(f"Warning: 'margin (%)' not found or invalid in product {product.get('name', 'Unknown')}")
+    return 0.0
+
 def calculate_relevance_score(product: Dict[str, Any], query: str, user_preferences: Dict[str, Any] = {}) -> float:
     """Calculate a relevance score for a product based on the query and user preferences."""
     try:
@@ -554,42 +850,10 @@ def calculate_relevance_score(product: Dict[str, Any], query: str, user_preferen
             print(f"Ingredient match for: {product.get('name', 'Unknown Product')}")
         
         # User preference bonuses
-        if user_preferences:
-            # Skin type preference bonus
-            if 'skin_type' in user_preferences:
-                skin_type = user_preferences['skin_type']
-                tags_lower = product.get('tags', '').lower()
-                if skin_type == 'dry' and any(term in tags_lower for term in ['hydrating', 'moisturizing', 'nourishing']):
-                    score += 1.0
-                    print(f"Skin type bonus (dry): {product.get('name', 'Unknown Product')}")
-                elif skin_type == 'oily' and any(term in tags_lower for term in ['oil-free', 'lightweight', 'mattifying']):
-                    score += 1.0
-                    print(f"Skin type bonus (oily): {product.get('name', 'Unknown Product')}")
-                elif skin_type == 'sensitive' and any(term in tags_lower for term in ['gentle', 'fragrance-free', 'hypoallergenic']):
-                    score += 1.0
-                    print(f"Skin type bonus (sensitive): {product.get('name', 'Unknown Product')}")
-            
-            # Concern-based bonus
-            if 'concerns' in user_preferences:
-                concerns = user_preferences['concerns']
-                tags_lower = product.get('tags', '').lower()
-                for concern in concerns:
-                    if concern == 'acne' and any(term in tags_lower for term in ['acne', 'blemish', 'salicylic']):
-                        score += 0.8
-                    elif concern == 'anti-aging' and any(term in tags_lower for term in ['anti-aging', 'retinol', 'peptide']):
-                        score += 0.8
-                    elif concern == 'dark_spots' and any(term in tags_lower for term in ['brightening', 'vitamin c', 'niacinamide']):
-                        score += 0.8
-                    elif concern == 'hydration' and any(term in tags_lower for term in ['hydrating', 'hyaluronic', 'moisturizing']):
-                        score += 0.8
+        score += get_preference_bonus(product, user_preferences)
         
         # Add margin as a business factor (0.1 to 0.5 points based on margin)
-        if 'margin (%)' in product and isinstance(product['margin (%)'], (int, float)):
-            margin_score = min(product['margin (%)'] * 0.01, 0.5)  # Cap at 0.5 points
-            score += margin_score
-            print(f"Margin bonus (+{margin_score:.2f}): {product.get('name', 'Unknown Product')}")
-        else:
-            print(f"Warning: 'margin (%)' not found or invalid in product {product.get('name', 'Unknown')}")
+        score += calculate_margin_bonus(product)
         
         print(f"Final score for {product.get('name', 'Unknown Product')}: {score}")
         return score
@@ -597,18 +861,29 @@ def calculate_relevance_score(product: Dict[str, Any], query: str, user_preferen
         print(f"Error calculating relevance score for {product.get('name', 'Unknown Product')}: {e}")
         return 0.0
 
-def simple_rank_products(products: List[Dict[str, Any]], query: str, user_preferences: Dict[str, Any] = {}) -> List[Dict[str, Any]]:
-    """Simple keyword-based ranking when Gemini is not available."""
+def simple_rank_products(products: List[Dict[str, Any]], query: str, user_preferences: Dict[str, Any] = {},
+                         related_to: List[str] = [], retrieved_ids: List[str] = []) -> List[Dict[str, Any]]:
+    """Simple keyword-based ranking when Gemini is not available.
+
+    Products frequently shown together with related_to (the previous turn's
+    products) get a COOCCURRENCE_WEIGHT bonus, and products in retrieved_ids
+    (retrieval hits, best first) a RETRIEVAL_RANK_BOOST bonus.
+    """
     print("\n=== Simple Ranking ===")
     query_lower = query.lower()
     print(f"Query (lowercase): {query_lower}")
     print(f"User preferences: {user_preferences}")
     
     # Calculate relevance scores for all products
+    retrieval_scores = retrieval_rank_scores(retrieved_ids)
+    cooccurrence_scores = cooccurrence.scores(related_to) if related_to else {}
     scored_products = []
     all_scores_zero = True
     for product in products:
         score = calculate_relevance_score(product, query, user_preferences)
+        product_id = str(product.get('product_id'))
+        score += RETRIEVAL_RANK_BOOST * retrieval_scores.get(product_id, 0.0)
+        score += COOCCURRENCE_WEIGHT * cooccurrence_scores.get(product_id, 0.0)
         scored_products.append((product, score))
         if score > 0:
             all_scores_zero = False
@@ -618,7 +893,7 @@ def simple_rank_products(products: List[Dict[str, Any]], query: str, user_prefer
         print(f"Category: {product.get('category', '')}")
     
     # Sort by score in descending order
-    ranked_products = [p for p, s in sorted(scored_products, key=lambda x: x[1], reverse=True)]
+    scored_products.sort(key=lambda x: x[1], reverse=True)
     
     # If all scores are zero, return the first 5 products from the original list
     if all_scores_zero:
@@ -626,7 +901,7 @@ def simple_rank_products(products: List[Dict[str, Any]], query: str, user_prefer
         return products[:5]
     
     # Otherwise, return the top products with a score > 0
-    filtered_ranked_products = [p for p in ranked_products if calculate_relevance_score(p, query, user_preferences) > 0]
+    filtered_ranked_products = [p for p, s in scored_products if s > 0]
     
     print(f"\nFound {len(filtered_ranked_products)} products with score > 0")
     if not filtered_ranked_products:
@@ -636,56 +911,148 @@ def simple_rank_products(products: List[Dict[str, Any]], query: str, user_prefer
     
     return filtered_ranked_products
 
-def rank_products(products: List[Dict[str, Any]], query: str, context: List[str], user_preferences: Dict[str, Any] = {}) -> List[Dict[str, Any]]:
-    """Rank products based on relevance, user preferences, and margin."""
-    if not model:
-        print("Using simple ranking as Gemini model is not available")
-        return simple_rank_products(products, query, user_preferences)[:5]
+# Per-product ranking arrays for the current catalog and product embeddings
+_ranking_features: Optional[RankingFeatures] = None
+
+def get_ranking_features(products) -> Optional[RankingFeatures]:
+    """Ranking features for a catalog, rebuilt when the catalog or the loaded product embeddings change."""
+    global _ranking_features
+    features = _ranking_features
+    if features is None or features.products is not products or features.version != product_index.version:
+        # A shared catalog's columns are zero-copy views of its file; plain records get theirs computed here
+        columns = products.derived if isinstance(products, SharedCatalog) else catalog_ranking_columns(products)
+        preference_bonus = {column[len(BONUS_COLUMN_PREFIX):]: values for column, values in columns.items()
+                            if column.startswith(BONUS_COLUMN_PREFIX)}
+        features = product_index.build_features(products, columns[MARGIN_BONUS_COLUMN], preference_bonus)
+        _ranking_features = features
+    return features
+
+def semantic_rank_products(products: List[Dict[str, Any]], query: str, user_preferences: Dict[str, Any] = {},
+                           related_to: List[str] = [], retrieved_ids: List[str] = [], limit: int = 5) -> List[Dict[str, Any]]:
+    """Return the top limit products by query embedding similarity blended with preference and margin bonuses.
 
+    Products frequently shown together with related_to (the previous turn's
+    products) get a co-occurrence bonus, and products in retrieved_ids
+    (retrieval hits, best first) a retrieval bonus. Scores are computed as
+    arrays over the whole catalog (see RankingFeatures). Returns an empty
+    list when product embeddings or the query embedder are unavailable.
+    """
+    print("\n=== Semantic Ranking ===")
+    if not embedding_service or not product_index.ensure_loaded(get_collection(), get_data_version()):
+        print("Product embeddings not available")
+        return []
     try:
-        # Use the flash model which has better free tier limits and is faster
-        # We will create a simpler prompt for it.
-        pref_context = ""
-        if user_preferences:
-            pref_parts = []
-            if 'skin_type' in user_preferences:
-                pref_parts.append(f"Skin type: {user_preferences['skin_type']}")
-            if 'concerns' in user_preferences:
-                pref_parts.append(f"Concerns: {', '.join(user_preferences['concerns'])}")
-            if pref_parts:
-                pref_context = f"\nUser preferences: {' | '.join(pref_parts)}"
-
-        prompt = f"""
-        Query: "{query}"{pref_context}
-        Context:
-        {chr(10).join([f'<doc>{text}</doc>' for text in context])}
+        query_embedding = embedding_service.embed_query(query)
+    except Exception as e:
+        print(f"Error embedding query: {e}")
+        return []
+
+    features = get_ranking_features(products)
+    if features is None:
+        print("Product embeddings not available")
+        return []
+    scores = (SEMANTIC_RANK_WEIGHT * features.similarities(query_embedding)
+              + features.preference_scores(preference_keys(user_preferences)) + features.margin_bonus)
+    if related_to:
+        features.add_bonus(scores, cooccurrence.scores(related_to), COOCCURRENCE_WEIGHT)
+    features.add_bonus(scores, retrieval_rank_scores(retrieved_ids), RETRIEVAL_RANK_BOOST)
+    return features.top(scores, limit)
+
+def build_rank_prompt(products: List[Dict[str, Any]], query: str, context: List[str], user_preferences: Dict[str, Any] = {}) -> str:
+    """Build the LLM ranking prompt for a product list."""
+    profile = format_user_profile(user_preferences)
+
+    # The catalog listing is what the model ranks, so it outranks the
+    # retrieved context when the budget is tight.
+    return (
+        PromptBuilder("rank")
+        .add("query", f'\n        Query: "{query}"', required=True)
+        .add("profile", f"\nUser preferences: {profile}" if profile else "", priority=1)
+        .add_items("context", context, priority=2, prefix="\n        Context:\n        ",
+                   item_format=lambda i, text: f"<doc>{text}</doc>")
+        .add("instructions", """
 
         Given the query, user preferences, and context, rank the following products by relevance. Consider tag matches, category relevance, description/ingredient matches, and user preferences.
         Return only the product_id for the top 5 most relevant products, one product_id per line.
 
-        Products: {products}
-        """
+""", required=True)
+        .add_items("products", products, priority=0, prefix="        Products: [", suffix="]\n        ",
+                   separator=", ")
+        .build()
+    )
+
+def rank_candidates(products: List[Dict[str, Any]], query: str, user_preferences: Dict[str, Any] = {},
+                    related_to: List[str] = [], retrieved_ids: List[str] = [],
+                    limit: int = RANK_PROMPT_CANDIDATES) -> List[Dict[str, Any]]:
+    """Shortlist up to limit products for the LLM ranking prompt, best local score first.
+
+    Uses the semantic ranker, or the keyword ranker when embeddings are
+    unavailable, topped up with the remaining products in catalog order. The
+    prompt budget drops products from the end, so the best candidates are
+    the last to go.
+    """
+    candidates = (semantic_rank_products(products, query, user_preferences, related_to, retrieved_ids, limit)
+                  or simple_rank_products(products, query, user_preferences, related_to, retrieved_ids)[:limit])
+    if len(candidates) < limit:
+        chosen = {str(p.get('product_id')) for p in candidates}
+        for product in products:
+            if len(candidates) >= limit:
+                break
+            if str(product.get('product_id')) not in chosen:
+                candidates.append(product)
+    return candidates
+
+def local_rank_products(products: List[Dict[str, Any]], query: str, user_preferences: Dict[str, Any] = {},
+                        related_to: List[str] = [], retrieved_ids: List[str] = []) -> List[Dict[str, Any]]:
+    """Rank without calling the LLM: semantic ranking, falling back to keyword ranking."""
+    ranked_products = semantic_rank_products(products, query, user_preferences, related_to, retrieved_ids)
+    return (ranked_products or simple_rank_products(products, query, user_preferences, related_to, retrieved_ids))[:5]
+
+def rank_products(products: List[Dict[str, Any]], query: str, context: List[str], user_preferences: Dict[str, Any] = {},
+                  related_to: List[str] = [], retrieved_ids: List[str] = []) -> List[Dict[str, Any]]:
+    """Rank products based on relevance, user preferences, and margin.
+
+    retrieved_ids are the product ids of the query's retrieval hits and
+    related_to the previous turn's products; the semantic and keyword rankers
+    use both as bonuses.
+    """
+    if RANKING_MODE == "semantic":
+        ranked_products = semantic_rank_products(products, query, user_preferences, related_to, retrieved_ids)
+        if ranked_products:
+            return ranked_products[:5]
+        print("Semantic ranking unavailable, falling back to LLM/simple ranking")
+
+    if not model:
+        print("Using simple ranking as Gemini model is not available")
+        return simple_rank_products(products, query, user_preferences, related_to, retrieved_ids)[:5]
+
+    try:
+        # Use the flash model which has better free tier limits and is faster
+        # We will create a simpler prompt for it.
+        candidates = rank_candidates(products, query, user_preferences, related_to, retrieved_ids)
+        prompt = build_rank_prompt(candidates, query, context, user_preferences)
         
-        response = model.generate_content(prompt)
+        response_text = generate_text("rank", prompt)
         # Assuming the response is a list of product IDs, one per line or comma separated
         # Split by lines and then potentially by commas/spaces if needed
         ranked_ids = []
-        for line in response.text.splitlines():
+        for line in response_text.splitlines():
             ranked_ids.extend([pid.strip() for pid in line.replace(',', ' ').split() if pid.strip()])
         
-        # Create a mapping of product IDs to their full data
-        product_map = {str(p.get('product_id')): p for p in products}
+        # Look up the full product data for each returned ID
+        find_product = product_lookup(candidates)
         
         # Return products in ranked order based on the LLM response
         ranked_products = []
         for pid in ranked_ids:
-            if pid in product_map:
-                ranked_products.append(product_map[pid])
+            product = find_product(pid)
+            if product is not None:
+                ranked_products.append(product)
         
         # If LLM ranking failed or didn't return enough products, fallback to simple ranking
         if not ranked_products or len(ranked_products) < 5:
              print("LLM ranking failed or insufficient results, falling back to simple ranking")
-             return simple_rank_products(products, query, user_preferences)[:5]
+             return simple_rank_products(products, query, user_preferences, related_to, retrieved_ids)[:5]
 
         # For now, just return the LLM ranked products up to 5
         
@@ -699,17 +1066,157 @@ def rank_products(products: List[Dict[str, Any]], query: str, context: List[str]
     except Exception as e:
         print(f"Error ranking products with LLM: {e}")
         print("Falling back to simple ranking")
-        return simple_rank_products(products, query, user_preferences)[:5]
+        return simple_rank_products(products, query, user_preferences, related_to, retrieved_ids)[:5]
 
 # Routes
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to Skincare Store API"}
 
+def prewarm_search_cache():
+    """Run the pipeline for the most popular logged queries so they start out cached.
+
+    Runs in its own thread; every LLM call it makes is admitted as a "prewarm"
+    call, whose reserve keeps most of the quota for live requests.
+    """
+    quota_call_type.set("prewarm")
+    try:
+        top_queries = query_log.top_queries(PREWARM_TOP_N) if PREWARM_TOP_N > 0 else []
+        print(f"Prewarming search cache with {len(top_queries)} popular queries")
+        data_version = get_data_version()
+        for query, signature in top_queries:
+            cache_key = (query, signature, data_version)
+            if search_cache.get(cache_key):
+                continue
+            try:
+                result = asyncio.run(run_search_pipeline(query, "", parse_preference_signature(signature)))
+                if result["shed_calls"]:
+                    # Out of LLM quota; don't fill the cache with fallback answers
+                    print(f"Stopping prewarm, LLM calls shed: {result['shed_calls']}")
+                    break
+                store_search_result(cache_key, result, whole=True, existing=None)
+                metrics.increment("search_cache.prewarmed")
+            except Exception as e:
+                print(f"Error prewarming query '{query}': {e}")
+    finally:
+        prewarm_done.set()
+        print("Search cache prewarm finished")
+
+@app.on_event("startup")
+async def start_prewarm():
+    threading.Thread(target=prewarm_search_cache, name="cache-prewarm", daemon=True).start()
+
+@app.on_event("shutdown")
+async def flush_query_log():
+    query_log.close()
+    cooccurrence.save(COOCCURRENCE_PATH)
+    cpu_executor.shutdown(wait=False)
+    llm_executor.shutdown(wait=False)
+
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 503 until the search cache has been prewarmed."""
+    if not prewarm_done.is_set():
+        raise HTTPException(status_code=503, detail="Prewarming search cache")
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Get process-wide counters (prompt tokens per call type, etc.)."""
+    return metrics.snapshot()
+
+# Opt-in sampling profiler for /search requests. The middleware is only
+# installed when PROFILER_TOKEN or PROFILE_SAMPLE_RATE is set, so it costs
+# nothing otherwise. Requests are profiled when they send the token in an
+# X-Profile header, after POST /admin/profile arms the next N requests, or at
+# random with probability PROFILE_SAMPLE_RATE.
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILED_PATHS = ("/search", "/search/stream")
+profiler = SamplingProfiler(
+    Path(os.getenv("PROFILE_DIR", "data/profiles")),
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+)
+
+class ProfileSearchRequests:
+    """ASGI middleware sampling the threads working on a selected /search request and storing its collapsed stacks.
+
+    The profile is finished when the wrapped app returns, i.e. after the whole
+    body (all of it, for /search/stream) has been sent or the client went away,
+    whether or not the response body ever started.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in PROFILED_PATHS:
+            return await self.app(scope, receive, send)
+        forced = bool(PROFILER_TOKEN) and Headers(scope=scope).get("X-Profile") == PROFILER_TOKEN
+        if not profiler.should_profile(forced, PROFILE_SAMPLE_RATE):
+            return await self.app(scope, receive, send)
+
+        profile = profiler.start(profile_name(scope["path"]))
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-Id", profile.name)
+            await send(message)
+
+        # Seen by the handler's task and, through BoundedExecutor.run, by its executor threads
+        token = current_profile.set(profile)
+        profiler.attach(profile, "event_loop")
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            current_profile.reset(token)
+            print(f"Wrote profile {profiler.finish(profile)}")
+
+if PROFILER_TOKEN or PROFILE_SAMPLE_RATE > 0:
+    app.add_middleware(ProfileSearchRequests)
+
+def check_profiler_token(token: Optional[str]) -> None:
+    # Admin endpoints don't exist unless a token is configured
+    if not PROFILER_TOKEN or token != PROFILER_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+
+@app.post("/admin/profile")
+async def arm_profiler(requests: int = 10, x_profile_token: Optional[str] = Header(None)):
+    """Profile the next N /search requests."""
+    check_profiler_token(x_profile_token)
+    profiler.arm(requests)
+    return {"armed": requests}
+
+@app.get("/admin/profiles")
+async def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    """List stored profiles, newest first."""
+    check_profiler_token(x_profile_token)
+    return profiler.list_profiles()
+
+@app.get("/admin/profiles/{name}", response_class=PlainTextResponse)
+async def get_profile(name: str, x_profile_token: Optional[str] = Header(None)):
+    """Return a stored profile in collapsed-stack format (flamegraph.pl, speedscope)."""
+    check_profiler_token(x_profile_token)
+    if name not in profiler.list_profiles():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return (profiler.output_dir / name).read_text()
+
 @app.get("/products")
 async def get_products():
-    products = load_catalog()
-    return products
+    products = await cpu_executor.run(load_catalog)
+    return [dict(p) for p in products]
+
+@app.get("/products/{product_id}/related")
+async def get_related_products(product_id: str, limit: int = 5):
+    """Products frequently shown together with a product."""
+    related = cooccurrence.related(product_id, limit)
+    if not related:
+        return []
+    find_product = product_lookup(await cpu_executor.run(load_catalog))
+    return [
+        {**product, "shown_together": count}
+        for product, count in ((find_product(pid), count) for pid, count in related) if product is not None
+    ]
 
 @app.get("/session/{session_id}")
 async def get_session_info(session_id: str):
@@ -736,175 +1243,449 @@ async def clear_session(session_data: dict):
         return {"message": "Session cleared successfully"}
     return {"message": "Session not found or already cleared"}
 
-@app.post("/search", response_model=SearchResponse)
-async def search_products(query: SearchQuery):
-    try:
-        print(f"\n=== New Search Request ===")
-        print(f"Query: {query.query}")
-        
-        # Classify the query
-        query_type = classify_query(query.query)
-        print(f"Query Type: {query_type}")
-        
-        # Get relevant context for both question answering and recommendations
+async def run_query_stages(query: str, timer: StageTimer) -> Dict[str, Any]:
+    """Classify the query, match it against the FAQ and retrieve context: the stages that don't depend on history."""
+    # Classify the query
+    with timer.stage("classify"):
+        query_type = await llm_executor.run(classify_query, query)
+    print(f"Query Type: {query_type}")
+
+    # Questions already answered in a support ticket skip answer generation
+    faq_match = None
+    if FAQ_ANSWERS and query_type == "QUESTION":
+        with timer.stage("faq"):
+            try:
+                faq_match = await cpu_executor.run(match_faq, query)
+            except ExecutorSaturated:
+                raise
+            except Exception as e:
+                print(f"Error matching FAQ: {e}")
+        if faq_match:
+            print(f"Answering from FAQ ticket {faq_match['ticket_id']} (similarity {faq_match['similarity']:.2f})")
+    
+    # Get relevant context for both question answering and recommendations
+    with timer.stage("retrieval"):
         try:
-            context = get_relevant_context(query.query)
-            print(f"Context found: {context}")
+            hits = await cpu_executor.run(retrieve, query)
+            print(f"Context found: {hits}")
+        except ExecutorSaturated:
+            raise
         except Exception as e:
             print(f"Error getting context: {e}")
-            context = []
+            hits = []
+    return {"query_type": query_type, "faq_match": faq_match, "hits": hits, "context": hit_documents(hits)}
 
-        # Get or create session
-        session_id = query.session_id
-        if not session_id:
-            session_id = create_session()
-            print(f"New session created: {session_id}")
-        else:
-            print(f"Existing session used: {session_id}")
-        
-        session_data = get_session(session_id)
-        if not session_data:
-            print(f"Session not found, creating new session data for: {session_id}")
-            session_data = {
-                "session_id": session_id,
-                "conversation_history": [],
-                "user_preferences": {},
-                "created_at": datetime.now(),
-                "last_activity": datetime.now()
-            }
-            sessions[session_id] = session_data
+async def run_search_pipeline(query: str, conversation_context: str = "", user_preferences: Dict[str, Any] = {},
+                              timer: Optional[StageTimer] = None, related_to: List[str] = [],
+                              query_stages: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Run classification, retrieval, answer generation, ranking and follow-up for a query.
+
+    Returns the session-independent part of a search response. Per-stage
+    latencies are recorded on timer when one is given. related_to holds the
+    products shown on the previous turn, used as a ranking signal.
+    query_stages, e.g. a cached entry for the same query and preferences,
+    supplies the classification, FAQ match and retrieval instead of running
+    them again.
+
+    Blocking work runs on the bounded executors (Gemini calls on llm_executor,
+    embedding, retrieval and catalog work on cpu_executor), and the answer,
+    ranking and follow-up stages run concurrently. Raises ExecutorSaturated
+    when an executor is full.
+
+    "shed_calls" in the result lists the LLM call types the quota scheduler
+    shed to local fallbacks; such degraded results should not be cached.
+    """
+    timer = timer or StageTimer()
+    # Each request (and each prewarm/refresh run) has its own context, so this set is per pipeline run
+    shed_calls.set(set())
+
+    stages = query_stages or await run_query_stages(query, timer)
+    query_type, faq_match, hits, context = (stages[key] for key in QUERY_STAGE_KEYS)
 
-        # Get all products
+    # Get all products
+    with timer.stage("catalog"):
         try:
-            products = load_catalog()
+            products = await cpu_executor.run(load_catalog)
             if not products:
                 print("No products found in catalog")
                 raise HTTPException(status_code=404, detail="No products found in catalog")
             print(f"Loaded {len(products)} products")
+        except ExecutorSaturated:
+            raise
         except Exception as e:
             print(f"Error loading catalog: {e}")
             raise HTTPException(status_code=500, detail=f"Error loading catalog: {str(e)}")
 
-        # Generate answer for both question and recommendation types
-        conversation_context = get_conversation_context(session_id)
-        user_preferences = session_data.get('user_preferences', {})
-        answer = generate_answer(query.query, context, conversation_context, user_preferences)
-        
-        # Rank products based on query, context, and user preferences
-        try:
-            ranked_products = rank_products(products, query.query, context, user_preferences)
-            print(f"Returning {len(ranked_products)} ranked products.")
-        except Exception as e:
-            print(f"Error ranking products: {e}")
-            ranked_products = []
-            print("Returning empty product list due to ranking error.")
+    # Generate answer for both question and recommendation types
+    async def answer_stage() -> str:
+        if faq_match:
+            return format_faq_answer(faq_match)
+        with timer.stage("answer"):
+            return await llm_executor.run(generate_answer, query, hits, conversation_context, user_preferences)
+    
+    # Rank products based on query, context, and user preferences
+    async def rank_stage() -> List[Dict[str, Any]]:
+        # Semantic ranking is local CPU work; LLM ranking waits on Gemini
+        rank_executor = llm_executor if RANKING_MODE == "llm" else cpu_executor
+        with timer.stage("rank"):
+            try:
+                ranked_products = await rank_executor.run(rank_products, products, query, context, user_preferences, related_to,
+                                                          retrieved_product_ids(hits))
+                # Copy out of the shared catalog so responses and the cache hold plain dicts
+                ranked_products = [dict(p) for p in ranked_products]
+                print(f"Returning {len(ranked_products)} ranked products.")
+                return ranked_products
+            except ExecutorSaturated:
+                raise
+            except Exception as e:
+                print(f"Error ranking products: {e}")
+                print("Returning empty product list due to ranking error.")
+                return []
 
-        # Generate follow-up question only for recommendation type
-        follow_up = None
-        if query_type == "RECOMMENDATION":
+    # Generate follow-up question only for recommendation type
+    async def follow_up_stage() -> Optional[str]:
+        if query_type != "RECOMMENDATION":
+            return None
+        with timer.stage("follow_up"):
             try:
-                follow_up = generate_follow_up_question(query.query, context, user_preferences, conversation_context)
+                follow_up = await llm_executor.run(generate_follow_up_question, query, context, user_preferences, conversation_context)
                 print(f"Follow-up question: {follow_up}")
+                return follow_up
+            except ExecutorSaturated:
+                raise
             except Exception as e:
                 print(f"Error generating follow-up: {e}")
-                follow_up = "What specific skin concerns are you targeting?"
-        
-        # Extract user preferences from the query
-        extract_user_preferences(session_id, query.query)
+                return "What specific skin concerns are you targeting?"
+
+    answer, ranked_products, follow_up = await asyncio.gather(answer_stage(), rank_stage(), follow_up_stage())
+
+    return {
+        "query_type": query_type,
+        "answer": answer,
+        "products": ranked_products,
+        "follow_up_question": follow_up,
+        "context": context,
+        "faq_match": faq_match,
+        "hits": hits,
+        "shed_calls": sorted(shed_calls.get()),
+    }
+
+def store_search_result(cache_key: Tuple, result: Dict[str, Any], whole: bool, existing: Optional[Dict[str, Any]]) -> None:
+    """Cache a pipeline result.
+
+    whole results (computed without conversation history) replace the entry;
+    otherwise only the history-independent stages are stored, and only if
+    there was no entry. Results with LLM calls shed to fallbacks aren't cached.
+    """
+    if result["shed_calls"]:
+        return
+    if whole:
+        search_cache.set(cache_key, dict(result, history_free=True))
+    elif existing is None:
+        search_cache.set(cache_key, dict({key: result[key] for key in QUERY_STAGE_KEYS}, history_free=False))
+
+async def refresh_cached_search(cache_key: Tuple, query: str, user_preferences: Dict[str, Any], whole: bool):
+    """Recompute a stale cache entry in the background (only its query stages unless whole)."""
+    try:
+        print(f"Refreshing cached search for: {query}")
+        if whole:
+            result = await run_search_pipeline(query, "", user_preferences)
+        else:
+            shed_calls.set(set())
+            result = dict(await run_query_stages(query, StageTimer()), shed_calls=sorted(shed_calls.get()))
+        if result["shed_calls"]:
+            # Keep serving the stale entry rather than replacing it with fallback output
+            search_cache.end_refresh(cache_key)
+            return
+        store_search_result(cache_key, result, whole, None)
+        metrics.increment("search_cache.refreshes")
+    except Exception as e:
+        print(f"Error refreshing cached search: {e}")
+        search_cache.end_refresh(cache_key)
 
-        # Add the conversation turn to the session history
-        add_to_conversation_history(session_id, query.query, query_type, answer, [p.get('product_id') for p in ranked_products])
+def lookup_search_cache(cache_key: Tuple, background: BackgroundTasks, query: str,
+                        user_preferences: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the cached entry for a key, scheduling a background refresh when it is stale."""
+    cached = search_cache.get(cache_key)
+    if not cached:
+        return None
+    entry, is_stale = cached
+    print(f"Found cached search entry (whole: {entry['history_free']}, stale: {is_stale})")
+    if is_stale and search_cache.begin_refresh(cache_key):
+        background.add_task(refresh_cached_search, cache_key, query, dict(user_preferences), entry["history_free"])
+    return entry
+
+def get_or_create_search_session(session_id: Optional[str]) -> Tuple[str, Dict]:
+    """Return (session_id, session data) for a search, creating the session if needed."""
+    # Get or create session
+    if not session_id:
+        session_id = create_session()
+        print(f"New session created: {session_id}")
+    else:
+        print(f"Existing session used: {session_id}")
+    
+    session_data = get_session(session_id)
+    if not session_data:
+        print(f"Session not found, creating new session data for: {session_id}")
+        session_data = {
+            "session_id": session_id,
+            "conversation_history": [],
+            "user_preferences": {},
+            "created_at": datetime.now(),
+            "last_activity": datetime.now()
+        }
+        sessions[session_id] = session_data
+    return session_id, session_data
+
+def finish_search_turn(session_id: str, query: str, result: Dict[str, Any], cache_key: Tuple, cached: bool,
+                       cacheable: bool, timer: StageTimer, request_start: float) -> None:
+    """Log the query and record the turn in the session (preferences and conversation history)."""
+    products_shown = [p.get('product_id') for p in result["products"]]
+    query_log.record({
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "query": cache_key[0],
+        "preferences": cache_key[1],
+        "query_type": result["query_type"],
+        "cached": cached,
+        # Turns without conversation history; only their keys are prewarmed
+        "cacheable": cacheable,
+        "latency_ms": timer.timings,
+        "total_ms": round((time.perf_counter() - request_start) * 1000, 2),
+        "products": products_shown,
+    })
+
+    # Extract user preferences from the query
+    extract_user_preferences(session_id, query)
+
+    # Add the conversation turn to the session history
+    add_to_conversation_history(session_id, query, result["query_type"], result["answer"], products_shown)
+
+@app.post("/search", response_model=SearchResponse)
+async def search_products(query: SearchQuery, background_tasks: BackgroundTasks):
+    global inflight_requests
+    # Admission control: shed load before doing any work
+    if inflight_requests >= MAX_INFLIGHT_REQUESTS:
+        metrics.increment("search.rejected_429")
+        raise HTTPException(status_code=429, detail="Too many requests in flight, please retry shortly",
+                            headers={"Retry-After": "1"})
+    inflight_requests += 1
+    try:
+        print(f"\n=== New Search Request ===")
+        print(f"Query: {query.query}")
+
+        session_id, session_data = get_or_create_search_session(query.session_id)
+
+        conversation_context = get_conversation_context(session_id)
+        user_preferences = session_data.get('user_preferences', {})
+
+        request_start = time.perf_counter()
+        timer = StageTimer()
+        data_version = await cpu_executor.run(get_data_version)
+        cache_key = (normalize_query(query.query), preference_signature(user_preferences), data_version)
+        entry = lookup_search_cache(cache_key, background_tasks, query.query, user_preferences)
+        # A whole cached result is only served to turns without history, so it never carries another
+        # session's conversation; turns with history reuse the cached query stages
+        cached = bool(entry and entry["history_free"] and not conversation_context)
+        if cached:
+            result = entry
+        else:
+            history = session_data.get("conversation_history", [])
+            related_to = history[-1].get("products_shown", []) if history else []
+            result = await run_search_pipeline(query.query, conversation_context, user_preferences, timer, related_to, entry)
+            store_search_result(cache_key, result, whole=not conversation_context, existing=entry)
+        
+        finish_search_turn(session_id, query.query, result, cache_key, cached, not conversation_context, timer, request_start)
         
         return SearchResponse(
-            query_type=query_type,
-            answer=answer,
-            products=ranked_products,
-            follow_up_question=follow_up,
-            context=context,
+            query_type=result["query_type"],
+            answer=result["answer"],
+            products=result["products"],
+            follow_up_question=result["follow_up_question"],
+            context=result["context"],
             session_id=session_id,
             conversation_context=get_conversation_context(session_id)
         )
+    except ExecutorSaturated as e:
+        print(f"Rejecting search, server overloaded: {e}")
+        metrics.increment("search.rejected_503")
+        raise HTTPException(status_code=503, detail="Server is overloaded, please retry shortly",
+                            headers={"Retry-After": "2"})
     except Exception as e:
         print(f"Unexpected error in search_products: {e}")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    finally:
+        inflight_requests -= 1
 
-def generate_fallback_answer(query: str, context: List[str], user_preferences: Dict[str, Any] = {}) -> str:
-    """Generate a helpful answer without using LLM based on context and query analysis."""
-    if not context:
-        return f"I couldn't find specific information related to \"{query}\" in my knowledge base. However, I've found some relevant products below that might help!"
-    
-    query_lower = query.lower()
-    
-    # Extract useful information from context
-    products_mentioned = []
-    categories_found = set()
-    ingredients_found = set()
-    
-    for ctx in context:
-        if "Product:" in ctx:
-            # Extract product name
-            lines = ctx.strip().split('\n')
-            for line in lines:
-                if line.strip().startswith("Product:"):
-                    product_name = line.replace("Product:", "").strip()
-                    products_mentioned.append(product_name)
-                elif line.strip().startswith("Category:"):
-                    category = line.replace("Category:", "").strip()
-                    categories_found.add(category)
-                elif line.strip().startswith("Ingredients:"):
-                    ingredients = line.replace("Ingredients:", "").strip()
-                    # Split ingredients by semicolon or comma
-                    for ingredient in ingredients.replace(';', ',').split(','):
-                        ingredients_found.add(ingredient.strip())
-    
-    # Build a contextual response
-    response_parts = []
-    
-    # User preference context
-    if user_preferences.get('skin_type'):
-        skin_type = user_preferences['skin_type']
-        response_parts.append(f"For your {skin_type} skin")
-    
-    # Query-specific responses
-    if any(word in query_lower for word in ['moisturizer', 'cream', 'hydrat']):
-        if 'dry' in query_lower or user_preferences.get('skin_type') == 'dry':
-            response_parts.append("I found some excellent hydrating options that should help with dryness.")
-        elif 'oily' in query_lower or user_preferences.get('skin_type') == 'oily':
-            response_parts.append("I found lightweight, oil-free moisturizers that won't clog pores.")
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def search_event_stream(query: str, session_id: str, session_data: Dict, background: BackgroundTasks) -> Any:
+    """Run the search pipeline for /search/stream, yielding SSE events as parts become ready.
+
+    Events, in order: session; query_type and products (with the retrieved
+    context), whichever is ready first; answer chunks; done with the
+    follow-up question and updated conversation context. Products are always
+    ranked locally so they don't wait on Gemini. Errors end the stream with an
+    error event. Refreshes of stale cache entries are added to background,
+    which runs after the response.
+    """
+    try:
+        yield sse_event("session", {"session_id": session_id})
+
+        conversation_context = get_conversation_context(session_id)
+        user_preferences = session_data.get('user_preferences', {})
+        request_start = time.perf_counter()
+        timer = StageTimer()
+        shed_calls.set(set())
+        data_version = await cpu_executor.run(get_data_version)
+        cache_key = (normalize_query(query), preference_signature(user_preferences), data_version)
+        entry = lookup_search_cache(cache_key, background, query, user_preferences)
+        cached = bool(entry and entry["history_free"] and not conversation_context)
+
+        if cached:
+            result = entry
+            yield sse_event("query_type", {"query_type": result["query_type"]})
+            yield sse_event("products", {"products": result["products"], "context": result["context"]})
+            yield sse_event("answer", {"text": result["answer"]})
         else:
-            response_parts.append("I found some great moisturizing products that should help.")
-    
-    elif any(word in query_lower for word in ['serum', 'treatment']):
-        response_parts.append("I found some targeted serums that could address your skincare concerns.")
-    
-    elif any(word in query_lower for word in ['spf', 'sunscreen', 'sun protection']):
-        response_parts.append("I found some excellent sun protection products to keep your skin safe.")
-    
-    elif any(word in query_lower for word in ['acne', 'breakout', 'blemish']):
-        response_parts.append("I found some products designed to help with acne and blemish control.")
-    
-    elif any(word in query_lower for word in ['sensitive', 'gentle']):
-        response_parts.append("I found some gentle, sensitive skin-friendly options.")
-    
-    else:
-        response_parts.append("Based on your query, I found some relevant products that might interest you.")
-    
-    # Add ingredient highlights if found
-    if ingredients_found:
-        key_ingredients = list(ingredients_found)[:3]  # Top 3 ingredients
-        response_parts.append(f"These products feature ingredients like {', '.join(key_ingredients)}.")
-    
-    # Add category information
-    if categories_found:
-        if len(categories_found) == 1:
-            category = list(categories_found)[0]
-            response_parts.append(f"All products are from the {category} category.")
-    
-    # Combine response parts
-    if response_parts:
-        return " ".join(response_parts) + " Check out the recommendations below!"
-    else:
-        return "I found some products that match your search. Take a look at the recommendations below!"
+            history = session_data.get("conversation_history", [])
+            related_to = history[-1].get("products_shown", []) if history else []
+
+            async def classify_stage() -> str:
+                if entry:
+                    return entry["query_type"]
+                with timer.stage("classify"):
+                    return await llm_executor.run(classify_query, query)
+
+            async def products_stage() -> Tuple[List[RetrievalHit], List[Dict[str, Any]]]:
+                if entry:
+                    hits = entry["hits"]
+                else:
+                    with timer.stage("retrieval"):
+                        hits = await cpu_executor.run(retrieve, query)
+                with timer.stage("catalog"):
+                    products = await cpu_executor.run(load_catalog)
+                with timer.stage("rank"):
+                    ranked_products = await cpu_executor.run(local_rank_products, products, query, user_preferences, related_to,
+                                                             retrieved_product_ids(hits))
+                return hits, [dict(p) for p in ranked_products]
+
+            classify_task = asyncio.create_task(classify_stage())
+            products_task = asyncio.create_task(products_stage())
+            pending = {classify_task, products_task}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if classify_task in done:
+                    yield sse_event("query_type", {"query_type": classify_task.result()})
+                if products_task in done:
+                    hits, ranked_products = products_task.result()
+                    context = hit_documents(hits)
+                    yield sse_event("products", {"products": ranked_products, "context": context})
+            query_type = classify_task.result()
+
+            follow_up_task = None
+            if query_type == "RECOMMENDATION":
+                follow_up_task = asyncio.create_task(
+                    llm_executor.run(generate_follow_up_question, query, context, user_preferences, conversation_context))
+            try:
+                if entry:
+                    faq_match = entry["faq_match"]
+                else:
+                    faq_match = await cpu_executor.run(match_faq, query) if FAQ_ANSWERS and query_type == "QUESTION" else None
+                if faq_match:
+                    answer = format_faq_answer(faq_match)
+                    yield sse_event("answer", {"text": answer})
+                else:
+                    # Gemini chunks arrive on an executor thread and are handed to the event loop through a queue
+                    loop = asyncio.get_running_loop()
+                    chunks: asyncio.Queue = asyncio.Queue()
+                    emit = lambda text: loop.call_soon_threadsafe(chunks.put_nowait, text)
+                    with timer.stage("answer"):
+                        answer_task = asyncio.ensure_future(llm_executor.run(
+                            stream_answer, query, hits, conversation_context, user_preferences, emit))
+                        while not (answer_task.done() and chunks.empty()):
+                            getter = asyncio.ensure_future(chunks.get())
+                            await asyncio.wait({getter, answer_task}, return_when=asyncio.FIRST_COMPLETED)
+                            if getter.done():
+                                yield sse_event("answer", {"text": getter.result()})
+                            else:
+                                getter.cancel()
+                        answer = answer_task.result()
+
+                follow_up = None
+                if follow_up_task:
+                    with timer.stage("follow_up"):
+                        follow_up = await follow_up_task
+            finally:
+                # The turn was abandoned: drop the follow-up if it is still queued (a running one finishes unused)
+                if follow_up_task and not follow_up_task.done():
+                    follow_up_task.cancel()
+
+            result = {
+                "query_type": query_type,
+                "answer": answer,
+                "products": ranked_products,
+                "follow_up_question": follow_up,
+                "context": context,
+                "faq_match": faq_match,
+                "hits": hits,
+                "shed_calls": sorted(shed_calls.get()),
+            }
+            # Streamed products are ranked locally; with RANKING_MODE=llm /search ranks differently,
+            # so only /search caches whole results then
+            store_search_result(cache_key, result, whole=not conversation_context and RANKING_MODE != "llm",
+                                existing=entry)
+
+        finish_search_turn(session_id, query, result, cache_key, cached, not conversation_context, timer, request_start)
+        yield sse_event("done", {
+            "answer": result["answer"],
+            "follow_up_question": result["follow_up_question"],
+            "session_id": session_id,
+            "conversation_context": get_conversation_context(session_id),
+        })
+    except ExecutorSaturated as e:
+        # Saturation after the response started; search_products_stream returns a 503 for the common case
+        print(f"Stopping search stream, server overloaded: {e}")
+        metrics.increment("search.stream_overloaded")
+        yield sse_event("error", {"detail": "Server is overloaded, please retry shortly"})
+    except Exception as e:
+        print(f"Unexpected error in search stream: {e}")
+        yield sse_event("error", {"detail": f"An unexpected error occurred: {str(e)}"})
+
+async def release_inflight_request():
+    global inflight_requests
+    inflight_requests -= 1
+
+@app.post("/search/stream")
+async def search_products_stream(query: SearchQuery):
+    """Streaming variant of /search over Server-Sent Events (see search_event_stream)."""
+    global inflight_requests
+    if inflight_requests >= MAX_INFLIGHT_REQUESTS:
+        metrics.increment("search.rejected_429")
+        raise HTTPException(status_code=429, detail="Too many requests in flight, please retry shortly",
+                            headers={"Retry-After": "1"})
+    # Once the stream has started the status can't change, so reject up front when an executor is full
+    if cpu_executor.saturated() or llm_executor.saturated():
+        print("Rejecting search stream, server overloaded")
+        metrics.increment("search.rejected_503")
+        raise HTTPException(status_code=503, detail="Server is overloaded, please retry shortly",
+                            headers={"Retry-After": "2"})
+    # Counted from admission, not from when the body starts streaming. The slot is released by the
+    # response's background tasks, which run after the body is sent or the client disconnects, even
+    # if the generator never started.
+    print(f"\n=== New Streaming Search Request ===")
+    print(f"Query: {query.query}")
+    session_id, session_data = get_or_create_search_session(query.session_id)
+    inflight_requests += 1
+    background = BackgroundTasks()
+    background.add_task(release_inflight_request)
+    return StreamingResponse(
+        search_event_stream(query.query, session_id, session_data, background),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background,
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,37 @@
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Any
+
+# Process-wide counters and gauges exposed through GET /metrics.
+# Kept in memory on purpose (in production, export to Prometheus or similar).
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, Callable[[], Any]] = {}
+
+def increment(name: str, value: float = 1) -> None:
+    """Add value to a named counter."""
+    with _lock:
+        _counters[name] += value
+
+def get(name: str) -> float:
+    """Return the current value of a counter (0 if never incremented)."""
+    with _lock:
+        return _counters.get(name, 0)
+
+def register_gauge(name: str, fn: Callable[[], Any]) -> None:
+    """Register a callable that is evaluated every time metrics are read."""
+    with _lock:
+        _gauges[name] = fn
+
+def snapshot() -> Dict[str, Any]:
+    """Return a copy of all counters plus the current gauge values."""
+    with _lock:
+        data: Dict[str, Any] = dict(_counters)
+        gauges = dict(_gauges)
+    for name, fn in gauges.items():
+        try:
+            data[name] = fn()
+        except Exception as e:
+            print(f"Error reading gauge {name}: {e}")
+            data[name] = None
+    return dict(sorted(data.items()))
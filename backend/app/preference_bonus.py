@@ -0,0 +1,66 @@
+from typing import Any, Dict, List, Sequence
+
+# Tag terms that earn a personalization bonus, per skin type and concern.
+# The preference space is small and fixed (see extract_user_preferences in
+# main.py), so each product's bonuses can be computed once per catalog load.
+SKIN_TYPE_TERMS: Dict[str, List[str]] = {
+    'dry': ['hydrating', 'moisturizing', 'nourishing'],
+    'oily': ['oil-free', 'lightweight', 'mattifying'],
+    'sensitive': ['gentle', 'fragrance-free', 'hypoallergenic'],
+}
+CONCERN_TERMS: Dict[str, List[str]] = {
+    'acne': ['acne', 'blemish', 'salicylic'],
+    'anti-aging': ['anti-aging', 'retinol', 'peptide'],
+    'dark_spots': ['brightening', 'vitamin c', 'niacinamide'],
+    'hydration': ['hydrating', 'hyaluronic', 'moisturizing'],
+}
+SKIN_TYPE_BONUS = 1.0
+CONCERN_BONUS = 0.8
+
+def compute_bonus_vector(product: Dict[str, Any]) -> Dict[str, float]:
+    """Bonus earned by a product for every skin type and concern, keyed 'skin_type:<x>' / 'concern:<x>'.
+
+    Only non-zero entries are stored.
+    """
+    tags_lower = product.get('tags', '')
+    tags_lower = tags_lower.lower() if isinstance(tags_lower, str) else ''
+    vector: Dict[str, float] = {}
+    for skin_type, terms in SKIN_TYPE_TERMS.items():
+        if any(term in tags_lower for term in terms):
+            vector[f"skin_type:{skin_type}"] = SKIN_TYPE_BONUS
+    for concern, terms in CONCERN_TERMS.items():
+        if any(term in tags_lower for term in terms):
+            vector[f"concern:{concern}"] = CONCERN_BONUS
+    return vector
+
+def build_bonus_table(products: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Bonus vectors for a whole catalog, keyed by product_id."""
+    return {str(p.get('product_id')): compute_bonus_vector(p) for p in products}
+
+def build_bonus_columns(products: Sequence[Dict[str, Any]]) -> Dict[str, List[float]]:
+    """Bonus per product for every skin type and concern key, as one column per key in catalog order."""
+    keys = [f"skin_type:{x}" for x in SKIN_TYPE_TERMS] + [f"concern:{x}" for x in CONCERN_TERMS]
+    columns: Dict[str, List[float]] = {key: [0.0] * len(products) for key in keys}
+    for i, product in enumerate(products):
+        for key, value in compute_bonus_vector(product).items():
+            columns[key][i] = value
+    return columns
+
+def preference_keys(user_preferences: Dict[str, Any]) -> List[str]:
+    """Bonus vector keys selected by the user's preferences (a concern listed twice counts twice)."""
+    if not user_preferences:
+        return []
+    keys = []
+    if 'skin_type' in user_preferences:
+        keys.append(f"skin_type:{user_preferences['skin_type']}")
+    keys.extend(f"concern:{concern}" for concern in user_preferences.get('concerns', []))
+    return keys
+
+def lookup_bonus(vector: Dict[str, float], user_preferences: Dict[str, Any]) -> float:
+    """Sum the entries of a bonus vector selected by the user's preferences."""
+    if not vector:
+        return 0.0
+    score = 0.0
+    for key in preference_keys(user_preferences):
+        score += vector.get(key, 0.0)
+    return score
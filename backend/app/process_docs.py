@@ -1,5 +1,7 @@
 import os
+import re
 from pathlib import Path
+from typing import Dict, List, Optional
 import pandas as pd
 import chromadb
 from chromadb.config import Settings
@@ -7,6 +9,12 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 import docx
 
+from .index_alias import new_version_name, read_active, write_active, collect_garbage
+from .embedding_service import create_embedding_service
+from .hnsw_config import hnsw_metadata
+from .faq_index import faq_collection_name, is_order_specific
+from .retrieval import product_metadata
+
 # Load environment variables
 load_dotenv()
 
@@ -23,11 +31,102 @@ def extract_text_from_docx(file_path):
         print(f"Error extracting text from {file_path}: {e}")
         return ""
 
-def process_documents():
-    """Process documents and create embeddings."""
+def clean_ticket_text(text: str) -> str:
+    return text.strip().strip('"“”').strip()
+
+def extract_faq_pairs(file_path) -> List[Dict[str, str]]:
+    """Extract customer-ticket question/answer pairs from the info DOCX.
+
+    Reads tickets from tables with "Customer Message" and "Support Response"
+    columns, and from "Ticket #N" / "Q:" / "A:" paragraphs. Order-specific
+    tickets (deliveries, refunds) are skipped.
+    """
+    try:
+        doc = docx.Document(file_path)
+    except Exception as e:
+        print(f"Error reading tickets from {file_path}: {e}")
+        return []
+
+    pairs = []
+    for table in doc.tables:
+        header = [cell.text.strip().lower() for cell in table.rows[0].cells]
+        if "customer message" not in header or "support response" not in header:
+            continue
+        id_col = header.index("ticket id") if "ticket id" in header else None
+        question_col, answer_col = header.index("customer message"), header.index("support response")
+        for i, row in enumerate(table.rows[1:]):
+            cells = [cell.text for cell in row.cells]
+            pairs.append({
+                "ticket_id": cells[id_col].strip() if id_col is not None else f"table-{i + 1}",
+                "question": clean_ticket_text(cells[question_col]),
+                "answer": clean_ticket_text(cells[answer_col]),
+            })
+
+    ticket_id, question = None, None
+    for paragraph in doc.paragraphs:
+        text = paragraph.text.strip()
+        heading = re.match(r"Ticket\s*#?\s*(\S+)", text)
+        if heading:
+            ticket_id, question = heading.group(1), None
+        elif text.startswith("Q:"):
+            question = clean_ticket_text(text[2:])
+        elif text.startswith("A:") and question:
+            pairs.append({"ticket_id": ticket_id or f"ticket-{len(pairs) + 1}", "question": question,
+                          "answer": clean_ticket_text(text[2:])})
+            question = None
+
+    return [p for p in pairs if p["question"] and p["answer"] and not is_order_specific(p["question"])]
+
+def build_product_documents(df: pd.DataFrame):
+    """Turn catalog rows into (documents, metadatas, ids) for the collection."""
+    documents = []
+    metadatas = []
+    ids = []
+    
+    for _, row in df.iterrows():
+        product_text = f"""
+                Product: {row['name']}
+                Category: {row['category']}
+                Description: {row['description']}
+                Ingredients: {row['top_ingredients']}
+                Tags: {row['tags']}
+                """
+        
+        documents.append(product_text)
+        metadatas.append(product_metadata(row))
+        ids.append(f"product_{row['product_id']}")
+    return documents, metadatas, ids
+
+def validate_collection(collection, expected_count: int, n_samples: int = 3) -> bool:
+    """Check the document count and that sample documents retrieve themselves."""
+    count = collection.count()
+    print(f"Final collection count: {count} documents (expected {expected_count})")
+    if count == 0 or count != expected_count:
+        print("Collection count does not match the number of documents added!")
+        return False
+
+    sample = collection.get(limit=n_samples, include=["documents"])
+    for doc_id, document in zip(sample["ids"], sample["documents"]):
+        # Near-identical chunks may outrank each other, so accept the document among the top 3
+        results = collection.query(query_texts=[document], n_results=min(3, count))
+        top_ids = results.get("ids", [[]])[0]
+        if doc_id not in top_ids:
+            print(f"Sample query for {doc_id} returned {top_ids}")
+            return False
+    print(f"Validated {len(sample['ids'])} sample queries")
+    return True
+
+def process_documents(base_dir: Optional[Path] = None):
+    """Process documents and create embeddings.
+
+    base_dir is the directory containing data/ (defaults to the backend directory).
+    """
+    chroma_client = None
+    collection_name = None
+    shadow_created = False
     try:
         # Use absolute path for ChromaDB
-        base_dir = Path(__file__).parent.parent
+        base_dir = Path(base_dir) if base_dir else Path(__file__).parent.parent
         chroma_dir = base_dir / "data" / "chroma_db"
         print(f"Using ChromaDB directory: {chroma_dir.absolute()}")
         
@@ -40,19 +139,18 @@ def process_documents():
             )
         )
 
-        # Delete existing collection if it exists
-        try:
-            chroma_client.delete_collection("skincare_docs")
-            print("Deleted existing collection")
-        except:
-            print("No existing collection to delete")
-
-        # Create new collection with default embedding function
+        # Build into a new versioned shadow collection; the live one keeps serving
+        collection_name = new_version_name()
+        embedding_service = create_embedding_service(warmup=False)
+        index_metadata = hnsw_metadata()
         collection = chroma_client.create_collection(
-            name="skincare_docs",
-            embedding_function=chromadb.utils.embedding_functions.DefaultEmbeddingFunction()
+            name=collection_name,
+            embedding_function=embedding_service or chromadb.utils.embedding_functions.DefaultEmbeddingFunction(),
+            metadata=index_metadata
         )
-        print("Created new collection")
+        shadow_created = True
+        print(f"Created shadow collection {collection_name} with {index_metadata}")
+        expected_count = 0
 
         # Process Excel catalog
         catalog_path = base_dir / "data" / "skincare catalog.xlsx"
@@ -63,22 +161,7 @@ def process_documents():
             print(f"Read {len(df)} rows from catalog")
             
             # Convert each product to a document
-            documents = []
-            metadatas = []
-            ids = []
-            
-            for _, row in df.iterrows():
-                product_text = f"""
-                Product: {row['name']}
-                Category: {row['category']}
-                Description: {row['description']}
-                Ingredients: {row['top_ingredients']}
-                Tags: {row['tags']}
-                """
-                
-                documents.append(product_text)
-                metadatas.append({"source": "catalog", "product_id": str(row['product_id'])})
-                ids.append(f"product_{row['product_id']}")
+            documents, metadatas, ids = build_product_documents(df)
             
             # Add all products at once
             if documents:
@@ -87,6 +170,7 @@ def process_documents():
                     metadatas=metadatas,
                     ids=ids
                 )
+                expected_count += len(documents)
                 print(f"Added {len(documents)} products to collection")
         else:
             print("Catalog file not found!")
@@ -110,16 +194,37 @@ def process_documents():
                     metadatas=[{"source": "additional_info", "chunk_id": str(i)} for i in range(len(chunks))],
                     ids=[f"info_{i}" for i in range(len(chunks))]
                 )
+                expected_count += len(chunks)
                 print(f"Added {len(chunks)} info chunks to collection")
         else:
             print("Additional info file not found!")
 
-        # Verify collection contents
-        count = collection.count()
-        print(f"Final collection count: {count} documents")
-        
-        if count == 0:
-            raise Exception("No documents were added to the collection!")
+        # Build the FAQ index of customer-ticket Q/A pairs next to the shadow collection
+        faq_pairs = extract_faq_pairs(info_path) if info_path.exists() else []
+        if faq_pairs:
+            faq_collection = chroma_client.create_collection(
+                name=faq_collection_name(collection_name),
+                embedding_function=embedding_service or chromadb.utils.embedding_functions.DefaultEmbeddingFunction(),
+                metadata={"hnsw:space": "cosine"}
+            )
+            faq_collection.add(
+                documents=[p["question"] for p in faq_pairs],
+                metadatas=[{"source": "customer_ticket", "ticket_id": p["ticket_id"], "answer": p["answer"]} for p in faq_pairs],
+                ids=[f"faq_{i}" for i in range(len(faq_pairs))]
+            )
+            print(f"Added {len(faq_pairs)} FAQ entries to {faq_collection.name}")
+
+        # Validate the shadow collection before it goes live
+        if not validate_collection(collection, expected_count):
+            raise Exception(f"Validation of {collection_name} failed, the active collection was left unchanged")
+
+        # Switch the alias; running servers pick up the new collection on their next request
+        previous_name = read_active(chroma_dir)
+        write_active(chroma_dir, collection_name, collection.count())
+        shadow_created = False
+        print(f"Switched active collection from {previous_name} to {collection_name}")
+
+        collect_garbage(chroma_client, chroma_dir, collection_name, keep=int(os.getenv("INDEX_VERSIONS_TO_KEEP", "2")))
 
         print("Document processing completed successfully")
         return True
@@ -128,6 +233,14 @@ def process_documents():
         print(f"Error processing documents: {e}")
         import traceback
         traceback.print_exc()
+        if shadow_created:
+            # The shadow never went live; drop it and its FAQ companion so failed runs don't pile up
+            for name in (collection_name, faq_collection_name(collection_name)):
+                try:
+                    chroma_client.delete_collection(name)
+                    print(f"Deleted unused shadow collection {name}")
+                except Exception:
+                    pass
         return False
 
 if __name__ == "__main__":
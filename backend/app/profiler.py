@@ -0,0 +1,159 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+
+# Profile of the request being handled, if it was picked for profiling, and the
+# pipeline stage currently running (set by StageTimer.stage). Both are copied
+# into executor threads by BoundedExecutor.run.
+current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+current_stage: ContextVar[str] = ContextVar("current_stage", default="request")
+
+class RequestProfile:
+    """Stack samples collected for one profiled request."""
+
+    def __init__(self, name: str, profiler: "SamplingProfiler"):
+        self.name = name
+        self.profiler = profiler
+        self.samples: Counter = Counter()
+        self.started = time.perf_counter()
+
+    def collapsed(self) -> str:
+        """Samples in collapsed-stack format ("root;child;leaf count" per line), as used by flamegraph.pl and speedscope."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+class SamplingProfiler:
+    """Low-overhead wall-clock sampling profiler for selected requests.
+
+    While at least one request is being profiled, a background thread reads
+    the stacks of the threads attached to those requests every interval
+    seconds. Each stack is recorded under its pipeline stage, so the output
+    separates, say, catalog parsing in cpu workers from waiting on Gemini in
+    llm workers. The event loop thread is shared by all requests, so its
+    samples (pydantic validation, response serialization) may include work
+    for concurrent requests.
+
+    No thread runs and nothing is sampled while no request is profiled.
+    """
+
+    def __init__(self, output_dir: Path, interval: float = 0.005, max_depth: int = 64, keep: int = 50):
+        self.output_dir = Path(output_dir)
+        self.interval = interval
+        self.max_depth = max_depth
+        self.keep = keep
+        self._attached: Dict[int, List[Tuple[RequestProfile, str]]] = {}
+        self._active = 0
+        self._armed = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def arm(self, requests: int) -> None:
+        """Profile the next `requests` requests."""
+        with self._lock:
+            self._armed = requests
+
+    def should_profile(self, forced: bool, sample_rate: float) -> bool:
+        """Decide whether to profile a request: forced by header, armed by the admin endpoint, or sampled."""
+        if forced:
+            return True
+        with self._lock:
+            if self._armed > 0:
+                self._armed -= 1
+                return True
+        return sample_rate > 0 and random.random() < sample_rate
+
+    def start(self, name: str) -> RequestProfile:
+        profile = RequestProfile(name, self)
+        with self._lock:
+            self._active += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        metrics.increment("profiler.requests")
+        return profile
+
+    def finish(self, profile: RequestProfile) -> Optional[Path]:
+        """Stop profiling a request and write its collapsed stacks to output_dir."""
+        with self._lock:
+            self._active -= 1
+            for attachments in self._attached.values():
+                attachments[:] = [a for a in attachments if a[0] is not profile]
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            path = self.output_dir / f"{profile.name}.collapsed"
+            path.write_text(profile.collapsed())
+            for old in sorted(self.output_dir.glob("*.collapsed"))[:-self.keep]:
+                old.unlink()
+            return path
+        except OSError as e:
+            print(f"Error writing profile {profile.name}: {e}")
+            return None
+
+    def attach(self, profile: RequestProfile, stage: str, thread_id: Optional[int] = None) -> int:
+        """Start sampling a thread (the current one by default) for a profile under a stage label."""
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            self._attached.setdefault(thread_id, []).append((profile, stage))
+        return thread_id
+
+    def detach(self, profile: RequestProfile, thread_id: Optional[int] = None) -> None:
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            attachments = self._attached.get(thread_id, [])
+            for i, (attached, _) in enumerate(attachments):
+                if attached is profile:
+                    del attachments[i]
+                    break
+            if not attachments:
+                self._attached.pop(thread_id, None)
+
+    def list_profiles(self) -> List[str]:
+        return sorted((p.name for p in self.output_dir.glob("*.collapsed")), reverse=True)
+
+    def _collapse(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _sample_loop(self) -> None:
+        while True:
+            with self._lock:
+                if self._active <= 0:
+                    self._thread = None
+                    return
+                attached = {tid: list(items) for tid, items in self._attached.items() if items}
+            frames = sys._current_frames()
+            for thread_id, items in attached.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = self._collapse(frame)
+                for profile, stage in items:
+                    profile.samples[f"[stage:{stage}];{stack}"] += 1
+            metrics.increment("profiler.samples")
+            time.sleep(self.interval)
+
+def run_attached(fn: Callable, *args, **kwargs) -> Any:
+    """Run fn, sampling the current thread if the calling request is being profiled."""
+    profile = current_profile.get()
+    if profile is None:
+        return fn(*args, **kwargs)
+    thread_id = profile.profiler.attach(profile, current_stage.get())
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profile.profiler.detach(profile, thread_id)
+
+def profile_name(path: str) -> str:
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{path.strip('/').replace('/', '_')}"
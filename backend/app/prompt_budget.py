@@ -0,0 +1,174 @@
+import os
+import re
+from typing import Callable, Dict, List, Optional, Any
+
+from . import metrics
+
+# Gemini's tokenizer is only reachable over the network (model.count_tokens),
+# so we estimate locally. ~4 characters per token is close enough for English
+# prompts and errs on the side of sending slightly less.
+CHARS_PER_TOKEN = 4
+
+# Default per-call token budgets, overridable with PROMPT_BUDGET_<CALL_TYPE>
+# environment variables (e.g. PROMPT_BUDGET_RANK=6000).
+DEFAULT_BUDGETS: Dict[str, int] = {
+    "classify": 256,
+    "answer": 2048,
+    "rank": 4096,
+    "follow_up": 1024,
+}
+
+# Items shorter than this are only deduplicated on exact match, never on containment
+MIN_DEDUP_CHARS = 40
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a piece of text."""
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+def record_sent(call_type: str, prompt: str) -> None:
+    """Count a prompt actually sent to the model (after quota admission, once per coalesced call)."""
+    metrics.increment(f"prompt.{call_type}.calls")
+    metrics.increment(f"prompt.{call_type}.tokens", estimate_tokens(prompt))
+
+def get_budget(call_type: str) -> int:
+    """Get the token budget for a call type from the environment or the defaults."""
+    value = os.getenv(f"PROMPT_BUDGET_{call_type.upper()}")
+    if value:
+        try:
+            return int(value)
+        except ValueError:
+            print(f"Invalid PROMPT_BUDGET_{call_type.upper()}={value!r}, using default")
+    return DEFAULT_BUDGETS.get(call_type, 2048)
+
+def format_user_profile(user_preferences: Dict[str, Any], separator: str = " | ", lowercase: bool = False) -> str:
+    """Render the known skin type and concerns of a user as a single line."""
+    parts = []
+    if user_preferences:
+        if 'skin_type' in user_preferences:
+            parts.append(f"{'skin type' if lowercase else 'Skin type'}: {user_preferences['skin_type']}")
+        if 'concerns' in user_preferences:
+            parts.append(f"{'concerns' if lowercase else 'Concerns'}: {', '.join(user_preferences['concerns'])}")
+    return separator.join(parts)
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+class PromptSection:
+    """One block of a prompt, made of one or more items that can be dropped independently."""
+
+    def __init__(self, name: str, items: List[Any], priority: int, required: bool,
+                 prefix: str, suffix: str, separator: str,
+                 item_format: Optional[Callable[[int, Any], str]], dedupe: bool):
+        self.name = name
+        self.items = list(items)
+        self.priority = priority
+        self.required = required
+        self.prefix = prefix
+        self.suffix = suffix
+        self.separator = separator
+        self.item_format = item_format or (lambda i, item: str(item))
+        self.dedupe = dedupe
+        self.rendered: List[str] = []
+
+    def render(self) -> str:
+        if not self.rendered:
+            return ""
+        return self.prefix + self.separator.join(self.rendered) + self.suffix
+
+class PromptBuilder:
+    """Assemble a prompt from prioritized sections so it fits a per-call token budget.
+
+    Sections are rendered in the order they are added. When the prompt is too
+    large, optional sections are filled in priority order (lower number first):
+    items that don't fit are dropped and the last text that only partly fits is
+    truncated. Items whose text already appears in a section kept earlier are
+    skipped, so the same document is never sent twice.
+    """
+
+    def __init__(self, call_type: str, budget: Optional[int] = None):
+        self.call_type = call_type
+        self.budget = budget if budget is not None else get_budget(call_type)
+        self.sections: List[PromptSection] = []
+        self.tokens = 0
+        self.dropped = 0
+
+    def add(self, name: str, text: str, priority: int = 0, required: bool = False) -> "PromptBuilder":
+        """Add a single block of text. Empty text adds nothing."""
+        if text:
+            self.sections.append(PromptSection(name, [text], priority, required, "", "", "", None, False))
+        return self
+
+    def add_items(self, name: str, items: List[Any], priority: int = 0, required: bool = False,
+                  prefix: str = "", suffix: str = "", separator: str = "\n",
+                  item_format: Optional[Callable[[int, Any], str]] = None,
+                  dedupe: bool = True) -> "PromptBuilder":
+        """Add a list of items (context documents, products, turns) rendered with item_format."""
+        self.sections.append(PromptSection(name, items, priority, required, prefix, suffix,
+                                           separator, item_format, dedupe))
+        return self
+
+    def build(self) -> str:
+        """Fit the sections to the budget, record token usage and return the prompt text."""
+        remaining = self.budget
+        seen_items = set()
+        kept_texts: List[str] = []
+
+        # Duplicates are detected on the raw item, not on its formatted text
+        def keep(section: PromptSection, text: str, item: Any):
+            section.rendered.append(text)
+            norm = _normalize(item)
+            seen_items.add(norm)
+            kept_texts.append(norm)
+
+        def is_duplicate(item: Any) -> bool:
+            norm = _normalize(item)
+            if norm in seen_items:
+                return True
+            if len(norm) >= MIN_DEDUP_CHARS:
+                return any(norm in kept for kept in kept_texts)
+            return False
+
+        # Required sections are always sent in full
+        for section in self.sections:
+            section.rendered = []
+            if section.required:
+                for i, item in enumerate(section.items):
+                    keep(section, section.item_format(i, item), item)
+                remaining -= estimate_tokens(section.render())
+
+        # Optional sections are filled by priority until the budget runs out
+        for section in sorted((s for s in self.sections if not s.required), key=lambda s: s.priority):
+            overhead = estimate_tokens(section.prefix + section.suffix)
+            if remaining <= overhead:
+                self.dropped += len(section.items)
+                continue
+            used = overhead
+            for i, item in enumerate(section.items):
+                text = section.item_format(len(section.rendered), item)
+                if section.dedupe and is_duplicate(item):
+                    self.dropped += 1
+                    continue
+                cost = estimate_tokens(text + section.separator)
+                if used + cost <= remaining:
+                    keep(section, text, item)
+                    used += cost
+                    continue
+                # Truncate the first item that doesn't fit if there is meaningful room left
+                room = (remaining - used) * CHARS_PER_TOKEN - len(section.separator) - 3
+                if room >= MIN_DEDUP_CHARS:
+                    keep(section, text[:room] + "...", item)
+                    used = remaining
+                self.dropped += len(section.items) - i - (1 if room >= MIN_DEDUP_CHARS else 0)
+                break
+            if not section.rendered:
+                used = 0
+            remaining -= used
+
+        prompt = "".join(section.render() for section in self.sections)
+        self.tokens = estimate_tokens(prompt)
+        if self.dropped:
+            metrics.increment(f"prompt.{self.call_type}.items_dropped", self.dropped)
+        print(f"Built {self.call_type} prompt: ~{self.tokens} tokens (budget {self.budget}, {self.dropped} items dropped)")
+        return prompt
@@ -0,0 +1,128 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from . import metrics
+from .profiler import current_stage
+
+class QueryLog:
+    """Append-only, size-rotated JSON-lines log of /search requests.
+
+    record() only puts the entry on an in-memory queue; a background thread
+    writes queued entries in batches, so the request path never touches the
+    disk. If the queue is full the entry is dropped rather than blocking.
+    The log is meant to have one writer: with several worker processes, give
+    each its own QUERY_LOG_PATH.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3,
+                 flush_interval: float = 1.0, max_queue: int = 10000):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+        self._thread.start()
+        metrics.register_gauge("query_log.queue_depth", self._queue.qsize)
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        """Queue an entry for writing without blocking."""
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            metrics.increment("query_log.dropped")
+
+    def close(self) -> None:
+        """Stop the writer after flushing everything queued so far."""
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._stop.wait(self.flush_interval)
+            self._flush()
+
+    def _flush(self) -> None:
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write("".join(json.dumps(entry, default=str) + "\n" for entry in batch))
+            metrics.increment("query_log.written", len(batch))
+            if self.path.stat().st_size >= self.max_bytes:
+                self._rotate()
+        except Exception as e:
+            print(f"Error writing query log: {e}")
+            metrics.increment("query_log.dropped", len(batch))
+
+    def _rotate(self) -> None:
+        if self.backup_count <= 0:
+            os.truncate(self.path, 0)
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            source = Path(f"{self.path}.{i}")
+            if source.exists():
+                os.replace(source, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def files(self) -> List[Path]:
+        """Current log file and its backups, oldest first."""
+        backups = [Path(f"{self.path}.{i}") for i in range(self.backup_count, 0, -1)]
+        return [p for p in backups + [self.path] if p.exists()]
+
+    def top_queries(self, n: int) -> List[Tuple[str, str]]:
+        """Most frequent (normalized query, preference signature) pairs across all log files.
+
+        Only turns logged as cacheable (answered without conversation history)
+        are counted, since only their keys are ever served a whole cached result.
+        """
+        counts: Counter = Counter()
+        for log_file in self.files():
+            try:
+                with open(log_file) as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        if entry.get("cacheable"):
+                            counts[(entry.get("query", ""), entry.get("preferences", ""))] += 1
+            except OSError as e:
+                print(f"Error reading query log {log_file}: {e}")
+        return [key for key, _ in counts.most_common(n) if key[0]]
+
+class StageTimer:
+    """Collect wall-clock latency (ms) per pipeline stage."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        # Label profiler samples taken during this stage
+        stage_token = current_stage.set(name)
+        try:
+            yield
+        finally:
+            try:
+                current_stage.reset(stage_token)
+            except ValueError:
+                # A streaming response's generator may be closed from another context
+                pass
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 2)
@@ -0,0 +1,96 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from . import metrics
+
+def normalize_query(query: str) -> str:
+    """Lowercase a query and collapse whitespace so trivially different spellings share a key."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+def preference_signature(user_preferences: Dict[str, Any]) -> str:
+    """Summarize the preferences that influence ranking and answers as a stable string."""
+    if not user_preferences:
+        return ""
+    skin_type = user_preferences.get('skin_type', '')
+    concerns = ",".join(sorted(user_preferences.get('concerns', [])))
+    return f"{skin_type}|{concerns}"
+
+def parse_preference_signature(signature: str) -> Dict[str, Any]:
+    """Inverse of preference_signature()."""
+    preferences: Dict[str, Any] = {}
+    if not signature:
+        return preferences
+    skin_type, _, concerns = signature.partition("|")
+    if skin_type:
+        preferences['skin_type'] = skin_type
+    if concerns:
+        preferences['concerns'] = concerns.split(",")
+    return preferences
+
+class ResponseCache:
+    """Size-bounded LRU cache with TTL and stale-while-revalidate semantics.
+
+    Entries younger than ttl are fresh. Entries between ttl and stale_ttl are
+    still served, but flagged so the caller can refresh them in the background.
+    Older entries are treated as misses.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300, stale_ttl: float = 3600, name: str = "cache"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.name = name
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        metrics.register_gauge(f"{name}.entries", lambda: len(self._entries))
+
+    def get(self, key: Tuple) -> Optional[Tuple[Any, bool]]:
+        """Return (value, is_stale) for a key, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                metrics.increment(f"{self.name}.misses")
+                return None
+            stored_at, value = entry
+            age = now - stored_at
+            if age > self.stale_ttl:
+                del self._entries[key]
+                metrics.increment(f"{self.name}.misses")
+                return None
+            self._entries.move_to_end(key)
+        is_stale = age > self.ttl
+        metrics.increment(f"{self.name}.stale_hits" if is_stale else f"{self.name}.hits")
+        return value, is_stale
+
+    def set(self, key: Tuple, value: Any) -> None:
+        """Store a value, evicting the least recently used entries beyond max_entries."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            self._refreshing.discard(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment(f"{self.name}.evictions")
+
+    def begin_refresh(self, key: Tuple) -> bool:
+        """Claim the background refresh of a key. Returns False if one is already running."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key: Tuple) -> None:
+        """Release a refresh claim (set() releases it too)."""
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._refreshing.clear()
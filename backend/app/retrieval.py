@@ -0,0 +1,52 @@
+from typing import Any, Dict, List, Optional, TypedDict
+
+# Catalog fields stored as metadata on product documents at ingestion, so
+# retrieval results can be used without parsing the document text
+PRODUCT_METADATA_FIELDS = ["name", "category", "top_ingredients", "tags"]
+
+class RetrievalHit(TypedDict):
+    """One retrieved document with its distance and metadata."""
+    document: str
+    distance: float
+    source: str  # "catalog" or "additional_info"
+    product_id: Optional[str]  # set for catalog documents
+    fields: Dict[str, Any]  # remaining metadata, e.g. PRODUCT_METADATA_FIELDS for products
+
+def product_metadata(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadata for a catalog row's document. Chroma metadata can't hold None/NaN, so missing values become ''."""
+    metadata = {"source": "catalog", "product_id": str(row["product_id"])}
+    for field in PRODUCT_METADATA_FIELDS:
+        value = row.get(field)
+        metadata[field] = "" if value is None or value != value else str(value)
+    return metadata
+
+def hits_from_query_result(results: Dict[str, Any]) -> List[RetrievalHit]:
+    """Turn a single-query Chroma result (documents, metadatas, distances included) into hits."""
+    documents = (results.get("documents") or [[]])[0]
+    metadatas = (results.get("metadatas") or [[]])[0] or [{}] * len(documents)
+    distances = (results.get("distances") or [[]])[0] or [0.0] * len(documents)
+    hits: List[RetrievalHit] = []
+    for document, metadata, distance in zip(documents, metadatas, distances):
+        metadata = dict(metadata or {})
+        hits.append(RetrievalHit(
+            document=document,
+            distance=float(distance),
+            source=metadata.pop("source", "unknown"),
+            product_id=metadata.pop("product_id", None),
+            fields=metadata,
+        ))
+    return hits
+
+def hit_documents(hits: List[RetrievalHit]) -> List[str]:
+    return [hit["document"] for hit in hits]
+
+def retrieved_product_ids(hits: List[RetrievalHit]) -> List[str]:
+    """Product ids of the catalog hits, best match first."""
+    return [hit["product_id"] for hit in hits if hit["source"] == "catalog" and hit["product_id"]]
+
+def retrieval_rank_scores(product_ids: List[str]) -> Dict[str, float]:
+    """Ranking bonus per retrieved product: 1 for the best hit, 1/2 for the second, and so on."""
+    scores: Dict[str, float] = {}
+    for rank, product_id in enumerate(product_ids):
+        scores.setdefault(product_id, 1.0 / (rank + 1))
+    return scores
@@ -0,0 +1,215 @@
+import json
+import os
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+MAGIC = b"SKCAT002"
+NUMERIC_COLUMNS = ["price (USD)", "margin (%)"]
+ID_COLUMN = "product_id"
+
+def _align(offset: int, alignment: int = 8) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+def write_catalog_file(records: List[Dict[str, Any]], columns: List[str], path: Path,
+                       derived: Optional[Dict[str, Sequence[float]]] = None) -> None:
+    """Write catalog records to a columnar file: float64 arrays for numeric columns,
+    an int64 offset array plus one UTF-8 blob for every text column.
+
+    derived holds extra per-row float64 columns computed from the records
+    (e.g. ranking bonuses), so workers can share them instead of each
+    recomputing its own copy.
+
+    The file is written to a temporary name and renamed, so readers only ever
+    see complete files.
+    """
+    n = len(records)
+    arrays: List[bytes] = []
+    layout: List[Dict[str, Any]] = []
+    position = 0
+
+    def add_array(data: bytes) -> int:
+        nonlocal position
+        start = _align(position)
+        arrays.append(b"\0" * (start - position) + data)
+        position = start + len(data)
+        return start
+
+    for column in columns:
+        values = [record.get(column) for record in records]
+        if column in NUMERIC_COLUMNS:
+            numbers = np.array([v if isinstance(v, (int, float)) else np.nan for v in values], dtype=np.float64)
+            layout.append({"name": column, "kind": "float", "data": add_array(numbers.tobytes())})
+        else:
+            encoded = [("" if v is None or (isinstance(v, float) and np.isnan(v)) else str(v)).encode("utf-8")
+                       for v in values]
+            offsets = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum([len(e) for e in encoded], out=offsets[1:])
+            layout.append({
+                "name": column,
+                "kind": "text",
+                "offsets": add_array(offsets.tobytes()),
+                "data": add_array(b"".join(encoded)),
+            })
+
+    derived_layout = []
+    for name, values in (derived or {}).items():
+        numbers = np.asarray(values, dtype=np.float64)
+        if len(numbers) != n:
+            raise ValueError(f"Derived column {name} has {len(numbers)} values for {n} rows")
+        derived_layout.append({"name": name, "data": add_array(numbers.tobytes())})
+
+    # Row numbers sorted by product_id, for binary-search lookups without a per-process dict
+    ids = [str(record.get(ID_COLUMN)) for record in records]
+    id_order = np.array(sorted(range(n), key=ids.__getitem__), dtype=np.int64)
+    id_order_offset = add_array(id_order.tobytes())
+
+    header = json.dumps({"rows": n, "columns": layout, "derived": derived_layout,
+                         "id_order": id_order_offset}).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        f.write(b"\0" * (data_start - len(MAGIC) - 8 - len(header)))
+        for chunk in arrays:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+
+class ProductView(Mapping):
+    """Read-only dict-like view of one catalog row; fields are decoded from the shared file on access."""
+
+    __slots__ = ("_catalog", "_row")
+
+    def __init__(self, catalog: "SharedCatalog", row: int):
+        self._catalog = catalog
+        self._row = row
+
+    @property
+    def catalog(self) -> "SharedCatalog":
+        return self._catalog
+
+    @property
+    def row(self) -> int:
+        """Row number of this product in its catalog, e.g. for indexing SharedCatalog.derived columns."""
+        return self._row
+
+    def __getitem__(self, key: str) -> Any:
+        return self._catalog.value(self._row, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._catalog.columns)
+
+    def __len__(self) -> int:
+        return len(self._catalog.columns)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+class SharedCatalog(Sequence):
+    """Catalog attached read-only from a memory-mapped columnar file.
+
+    Every worker process maps the same file, so the OS page cache holds a
+    single copy of the catalog however many workers there are. Rows are
+    exposed as ProductView mappings, which behave like the dict records
+    load_catalog used to return but must not be mutated.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._buffer = np.memmap(self.path, dtype=np.uint8, mode="r")
+        if bytes(self._buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{self.path} is not a catalog file")
+        header_length = int.from_bytes(bytes(self._buffer[len(MAGIC):len(MAGIC) + 8]), "little")
+        header_start = len(MAGIC) + 8
+        header = json.loads(bytes(self._buffer[header_start:header_start + header_length]))
+        data_start = _align(header_start + header_length)
+
+        self.rows: int = header["rows"]
+        self.columns: List[str] = [column["name"] for column in header["columns"]]
+        self._numeric: Dict[str, np.ndarray] = {}
+        self._text: Dict[str, tuple] = {}
+        for column in header["columns"]:
+            if column["kind"] == "float":
+                self._numeric[column["name"]] = self._array(data_start + column["data"], np.float64, self.rows)
+            else:
+                offsets = self._array(data_start + column["offsets"], np.int64, self.rows + 1)
+                self._text[column["name"]] = (offsets, data_start + column["data"])
+        # Zero-copy float64 views of the derived columns written with the file
+        self.derived: Dict[str, np.ndarray] = {
+            column["name"]: self._array(data_start + column["data"], np.float64, self.rows)
+            for column in header["derived"]
+        }
+        self._id_order = self._array(data_start + header["id_order"], np.int64, self.rows)
+
+    def _array(self, offset: int, dtype, count: int) -> np.ndarray:
+        return np.frombuffer(self._buffer, dtype=dtype, count=count, offset=offset)
+
+    def numeric_column(self, name: str) -> np.ndarray:
+        """Zero-copy float64 view of a numeric column (price, margin)."""
+        return self._numeric[name]
+
+    def value(self, row: int, column: str) -> Any:
+        if column in self._numeric:
+            return float(self._numeric[column][row])
+        if column in self._text:
+            offsets, data = self._text[column]
+            return bytes(self._buffer[data + offsets[row]:data + offsets[row + 1]]).decode("utf-8")
+        raise KeyError(column)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ProductView(self, row) for row in range(*index.indices(self.rows))]
+        if index < 0:
+            index += self.rows
+        if not 0 <= index < self.rows:
+            raise IndexError(index)
+        return ProductView(self, index)
+
+    def by_id(self, product_id: str) -> Optional[ProductView]:
+        """Look up a product by product_id with a binary search over the shared sort order."""
+        product_id = str(product_id)
+        low, high = 0, self.rows
+        while low < high:
+            middle = (low + high) // 2
+            if self.value(int(self._id_order[middle]), ID_COLUMN) < product_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.rows:
+            row = int(self._id_order[low])
+            if self.value(row, ID_COLUMN) == product_id:
+                return ProductView(self, row)
+        return None
+
+def attach_or_build(records_loader, source_path: Path, cache_dir: Path,
+                    derive: Optional[Callable[[List[Dict[str, Any]]], Dict[str, Sequence[float]]]] = None) -> SharedCatalog:
+    """Attach the shared file for the current catalog version, building it first if no worker has yet.
+
+    records_loader() must return (records, columns) parsed from source_path;
+    derive(records), if given, returns the derived columns to store with them.
+    Files for older catalog versions or file formats are removed when a new
+    one is written.
+    """
+    version = Path(source_path).stat().st_mtime_ns
+    path = Path(cache_dir) / f"catalog-{version}-{MAGIC.decode().lower()}.bin"
+    if not path.exists():
+        records, columns = records_loader()
+        write_catalog_file(records, columns, path, derive(records) if derive else None)
+        print(f"Wrote shared catalog file {path} ({len(records)} products)")
+        for old in Path(cache_dir).glob("catalog-*.bin"):
+            if old != path:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+    return SharedCatalog(path)
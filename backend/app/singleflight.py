@@ -0,0 +1,60 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+from . import metrics
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one in-flight computation.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running wait for and share its result or
+    exception. Once the computation finishes the key is forgotten, so this is
+    not a cache: later calls run the function again.
+
+    Results are shared between callers and must be treated as read-only.
+
+    do() blocks the calling thread, so it is meant for code running on the
+    executors (see BoundedExecutor): waiters block their executor thread,
+    never the event loop. The leader's work runs in its own thread and is
+    not cancelled if a waiting request goes away.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        metrics.register_gauge(f"singleflight.{name}.in_flight", lambda: len(self._calls))
+
+    def _join(self, key: Hashable):
+        """Return (future, is_leader) for a key, registering a new future if none is in flight."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                metrics.increment(f"singleflight.{self.name}.coalesced")
+                return future, False
+            future = Future()
+            self._calls[key] = future
+        metrics.increment(f"singleflight.{self.name}.executed")
+        return future, True
+
+    def _run(self, key: Hashable, future: Future, fn: Callable[[], Any]) -> None:
+        try:
+            result = fn()
+        except BaseException as e:
+            self._forget(key)
+            future.set_exception(e)
+        else:
+            self._forget(key)
+            future.set_result(result)
+
+    def _forget(self, key: Hashable) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn for key in the calling thread, or wait for the identical call already running."""
+        future, is_leader = self._join(key)
+        if is_leader:
+            self._run(key, future, fn)
+        return future.result()
@@ -0,0 +1 @@
+# Synthetic data generators and microbenchmarks
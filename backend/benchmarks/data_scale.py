@@ -0,0 +1,116 @@
+"""Time and peak memory of the data-path functions at increasing catalog sizes.
+
+Measures load_catalog, calculate_relevance_score/simple_rank_products,
+build_rank_prompt (the rank_products prompt) and process_documents ingestion
+against synthetic catalogs from benchmarks.synthetic_catalog.
+
+Each function runs twice: once for wall time with tracing off, and once under
+tracemalloc for peak memory (tracing slows Python-heavy code several-fold, so
+the two are never taken from the same run). tracemalloc only sees allocations
+made through Python's allocator; native memory of the ONNX embedding model and
+Chroma's HNSW index during process_documents is not included in its peak.
+
+Usage (from backend/):
+    python -m benchmarks.data_scale --sizes 1000 10000 100000 --ingest-max 10000
+"""
+import argparse
+import contextlib
+import gc
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+from .synthetic_catalog import write_dataset
+
+QUERY = "I have dry skin, what hydrating moisturizer do you recommend?"
+PREFERENCES = {"skin_type": "dry", "concerns": ["hydration", "anti-aging"]}
+CONTEXT = [
+    "Product: Dewdrop Hydration Elixir\nCategory: Serum\nIngredients: Hyaluronic Acid; Panthenol; Vitamin F (Linoleic Acid)\nTags: hydration|barrier-repair|dry-skin",
+    "Ticket #12\nQ: Will Aqua Hydra Moisturizer work for dry skin?\nA: Customers with dry skin report good results.",
+]
+
+def measure(fn: Callable[[], Any], reset: Optional[Callable[[], None]] = None) -> Tuple[float, float, Any]:
+    """Run fn with stdout silenced: a timing pass without tracing, then a tracemalloc pass.
+
+    reset, if given, runs before each pass to drop caches the first pass filled.
+    Returns (seconds, peak MiB of Python allocations, result of the timing pass).
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if reset:
+            reset()
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+
+        if reset:
+            reset()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024), result
+
+def run(sizes: List[int], ingest_max: int, work_dir: Path) -> List[Tuple[str, int, float, float]]:
+    # main.py reads data/ relative to the working directory, so each size gets its own directory
+    from app import main
+    from app.process_docs import process_documents
+
+    original_cwd = os.getcwd()
+    rows = []
+    try:
+        for size in sizes:
+            size_dir = work_dir / f"catalog_{size}"
+            write_dataset(size_dir, size)
+            os.chdir(size_dir)
+
+            def reset_catalog():
+                # Force a full parse (and shared catalog file build) on every pass
+                main._catalog_cache.update(mtime=None, records=[])
+                shutil.rmtree(main.SHARED_CATALOG_DIR, ignore_errors=True)
+
+            seconds, peak, products = measure(main.load_catalog, reset=reset_catalog)
+            rows.append(("load_catalog", size, seconds, peak))
+
+            seconds, peak, _ = measure(lambda: [main.calculate_relevance_score(p, QUERY, PREFERENCES) for p in products])
+            rows.append(("calculate_relevance_score (all)", size, seconds, peak))
+
+            seconds, peak, _ = measure(lambda: main.simple_rank_products(products, QUERY, PREFERENCES))
+            rows.append(("simple_rank_products", size, seconds, peak))
+
+            seconds, peak, _ = measure(lambda: main.build_rank_prompt(products, QUERY, CONTEXT, PREFERENCES))
+            rows.append(("build_rank_prompt", size, seconds, peak))
+
+            if size <= ingest_max:
+                seconds, peak, _ = measure(lambda: process_documents(size_dir))
+                rows.append(("process_documents", size, seconds, peak))
+
+            os.chdir(original_cwd)
+    finally:
+        os.chdir(original_cwd)
+    return rows
+
+def print_report(rows: List[Tuple[str, int, float, float]]) -> None:
+    print(f"\n{'function':<34}{'products':>10}{'seconds':>12}{'py peak MiB':>12}{'us/product':>12}")
+    for name, size, seconds, peak in rows:
+        print(f"{name:<34}{size:>10}{seconds:>12.4f}{peak:>12.1f}{seconds * 1e6 / size:>12.2f}")
+    print("\nseconds: untraced run; py peak MiB: tracemalloc peak, excluding native ONNX/Chroma memory")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--ingest-max", type=int, default=10000,
+                        help="largest catalog to run process_documents on (embedding is slow)")
+    parser.add_argument("--work-dir", type=Path, default=None)
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="skincare_bench_"))
+    print(f"Writing synthetic datasets to {work_dir}")
+    print_report(run(args.sizes, args.ingest_max, work_dir))
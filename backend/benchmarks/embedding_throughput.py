@@ -0,0 +1,78 @@
+"""Query embedding throughput: Chroma's DefaultEmbeddingFunction vs the app's EmbeddingService.
+
+Measures sequential single-query latency and concurrent throughput (many
+threads embedding different queries at once, as under /search load) for the
+default function and for EmbeddingService with the float and int8 models.
+
+Usage (from backend/):
+    python -m benchmarks.embedding_throughput --queries 500 --concurrency 16 --threads 2
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import numpy as np
+from chromadb.utils import embedding_functions
+
+from app.embedding_service import EmbeddingService
+from .synthetic_catalog import generate_catalog
+
+def make_queries(n: int) -> List[str]:
+    catalog = generate_catalog(n, seed=7)
+    return [f"what {row.category.lower()} is best for {row.tags.split('|')[0]} skin" for row in catalog.itertuples()]
+
+def run_sequential(embed_one: Callable[[str], object], queries: List[str]) -> Dict[str, float]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        embed_one(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "qps": len(queries) / (sum(latencies) / 1000),
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+def run_concurrent(embed_one: Callable[[str], object], queries: List[str], concurrency: int) -> Dict[str, float]:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(embed_one, queries))
+    return {"qps": len(queries) / (time.perf_counter() - start)}
+
+def main(n_queries: int, concurrency: int, threads: int) -> None:
+    queries = make_queries(n_queries)
+
+    start = time.perf_counter()
+    default_fn = embedding_functions.DefaultEmbeddingFunction()
+    default_fn(["cold start"])
+    default_cold = time.perf_counter() - start
+
+    candidates = {"chroma default": lambda q: default_fn([q])[0]}
+    cold_starts = {"chroma default": default_cold}
+    for label, quantized in (("service float32", False), ("service int8", True)):
+        start = time.perf_counter()
+        # cache_size=0 so every call really runs the model
+        service = EmbeddingService(intra_op_threads=threads, quantized=quantized, cache_size=0)
+        cold_starts[label] = time.perf_counter() - start
+        candidates[label] = service.embed_query
+
+    reference = np.asarray(default_fn(queries[:50]))
+    print(f"\n{'embedder':<18}{'cold s':>9}{'seq qps':>10}{'p50 ms':>9}{'p99 ms':>9}{'conc qps':>10}{'cos vs default':>16}")
+    for label, embed_one in candidates.items():
+        sequential = run_sequential(embed_one, queries)
+        concurrent = run_concurrent(embed_one, queries, concurrency)
+        vectors = np.asarray([embed_one(q) for q in queries[:50]])
+        similarity = float(np.mean(np.sum(vectors * reference, axis=1)))
+        print(f"{label:<18}{cold_starts[label]:>9.2f}{sequential['qps']:>10.1f}{sequential['p50_ms']:>9.2f}"
+              f"{sequential['p99_ms']:>9.2f}{concurrent['qps']:>10.1f}{similarity:>16.4f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=0, help="ONNX intra-op threads for the service (0 = default)")
+    args = parser.parse_args()
+    main(args.queries, args.concurrency, args.threads)
@@ -0,0 +1,114 @@
+"""HNSW parameter tuning: recall@k against exact search and query latency per configuration.
+
+Builds the catalog documents the way process_docs.py does (from a synthetic
+catalog, or the real one with --catalog), embeds them once, then creates one
+Chroma collection per combination of space / M / construction_ef / search_ef.
+Each configuration is queried with a held-out query set (generated from a
+different seed than the corpus) and compared with brute-force exact nearest
+neighbours computed in NumPy.
+
+Usage (from backend/):
+    python -m benchmarks.hnsw_tuning --products 20000 --queries 200 --k 3 10 \\
+        --m 16 32 --construction-ef 100 200 --search-ef 10 50 100
+
+Pick a row and set HNSW_SPACE / HNSW_M / HNSW_CONSTRUCTION_EF /
+HNSW_SEARCH_EF (and RETRIEVAL_N_RESULTS) before reindexing.
+"""
+import argparse
+import itertools
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import chromadb
+import numpy as np
+import pandas as pd
+from chromadb.config import Settings
+from chromadb.utils import embedding_functions
+
+from app.embedding_service import create_embedding_service
+from app.hnsw_config import hnsw_metadata
+from app.process_docs import build_product_documents
+from .synthetic_catalog import generate_catalog
+
+ADD_BATCH = 5000
+
+def make_queries(n: int) -> List[str]:
+    catalog = generate_catalog(n, seed=1234)
+    return [f"{row.tags.split('|')[0]} {row.category.lower()} with {row.top_ingredients.split('; ')[0].lower()}"
+            for row in catalog.itertuples()]
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, space: str, k: int) -> np.ndarray:
+    """Indices of the k nearest corpus vectors for each query, using the HNSW space's distance."""
+    if space == "l2":
+        distances = (queries ** 2).sum(1)[:, None] - 2 * queries @ corpus.T + (corpus ** 2).sum(1)[None, :]
+    elif space == "cosine":
+        corpus_norm = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+        queries_norm = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        distances = 1 - queries_norm @ corpus_norm.T
+    else:
+        distances = 1 - queries @ corpus.T
+    return np.argsort(distances, axis=1)[:, :k]
+
+def evaluate(client, ids: List[str], corpus: np.ndarray, queries: np.ndarray, config: Dict, ks: List[int]) -> Dict:
+    collection = client.create_collection(name="hnsw_tuning", metadata=hnsw_metadata(**config))
+    try:
+        start = time.perf_counter()
+        for i in range(0, len(ids), ADD_BATCH):
+            collection.add(ids=ids[i:i + ADD_BATCH], embeddings=corpus[i:i + ADD_BATCH].tolist())
+        build_seconds = time.perf_counter() - start
+
+        k_max = max(ks)
+        latencies = []
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            response = collection.query(query_embeddings=[query.tolist()], n_results=k_max, include=[])
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append(response["ids"][0])
+    finally:
+        client.delete_collection("hnsw_tuning")
+
+    truth = exact_neighbours(corpus, queries, config["space"], k_max)
+    row = {"build_s": build_seconds,
+           "p50_ms": float(np.percentile(latencies, 50)),
+           "p99_ms": float(np.percentile(latencies, 99))}
+    for k in ks:
+        hits = [len(set(found[:k]) & {ids[j] for j in expected[:k]}) for found, expected in zip(results, truth)]
+        row[f"recall@{k}"] = sum(hits) / (k * len(queries))
+    return row
+
+def main(products: int, catalog: Optional[Path], n_queries: int, ks: List[int], spaces: List[str],
+         ms: List[int], construction_efs: List[int], search_efs: List[int]) -> None:
+    df = pd.read_excel(catalog) if catalog else generate_catalog(products, seed=42)
+    documents, _, ids = build_product_documents(df)
+
+    embed = create_embedding_service() or embedding_functions.DefaultEmbeddingFunction()
+    start = time.perf_counter()
+    corpus = np.asarray(embed(documents), dtype=np.float32)
+    queries = np.asarray(embed(make_queries(n_queries)), dtype=np.float32)
+    print(f"Embedded {len(documents)} documents and {len(queries)} queries in {time.perf_counter() - start:.1f}s")
+
+    client = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False, allow_reset=True))
+    recall_columns = [f"recall@{k}" for k in ks]
+    print(f"\n{'space':<8}{'M':>5}{'c_ef':>6}{'s_ef':>6}{'build s':>9}{'p50 ms':>9}{'p99 ms':>9}"
+          + "".join(f"{c:>11}" for c in recall_columns))
+    for space, m, construction_ef, search_ef in itertools.product(spaces, ms, construction_efs, search_efs):
+        config = {"space": space, "M": m, "construction_ef": construction_ef, "search_ef": search_ef}
+        row = evaluate(client, ids, corpus, queries, config, ks)
+        print(f"{space:<8}{m:>5}{construction_ef:>6}{search_ef:>6}{row['build_s']:>9.2f}{row['p50_ms']:>9.2f}"
+              f"{row['p99_ms']:>9.2f}" + "".join(f"{row[c]:>11.3f}" for c in recall_columns))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20000, help="synthetic catalog size")
+    parser.add_argument("--catalog", type=Path, help="use this catalog .xlsx instead of a synthetic one")
+    parser.add_argument("--queries", type=int, default=200, help="held-out queries")
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 10])
+    parser.add_argument("--space", nargs="+", default=["l2"], choices=["l2", "cosine", "ip"])
+    parser.add_argument("--m", type=int, nargs="+", default=[16])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100])
+    args = parser.parse_args()
+    main(args.products, args.catalog, args.queries, args.k, args.space, args.m,
+         args.construction_ef, args.search_ef)
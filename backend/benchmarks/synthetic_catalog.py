@@ -0,0 +1,152 @@
+"""Generate synthetic catalogs, modelled on the bundled one, and customer-ticket documents of any size.
+
+Usage (from backend/):
+    python -m benchmarks.synthetic_catalog --products 100000 --out /tmp/catalog_100k
+"""
+import argparse
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+CATALOG_COLUMNS = ["product_id", "name", "category", "description", "top_ingredients",
+                   "tags", "price (USD)", "margin (%)"]
+
+# Vocabularies, shares and formats follow data/skincare catalog.xlsx: categories
+# with their id prefixes, three "; "-separated ingredients, three or four
+# "|"-separated tags drawn with the real tag frequencies, whole-dollar prices
+# and margins stored as fractions (0.34-0.55).
+CATEGORIES = {
+    "Serum": ("SRM", 10), "Cream / Moisturizer": ("CRM", 10), "Toner": ("TNR", 5), "Face Mask": ("MSK", 3),
+    "Body Wash": ("BW", 3), "Shampoo": ("HC", 3), "Conditioner": ("HC", 3), "Sunscreen": ("SNS", 1),
+    "Hair Mask": ("HC", 1),
+}
+
+BRAND_WORDS = ["Radiant", "Dewdrop", "Clear Slate", "Midnight", "Calm & Soothe", "Velvet", "AquaShield",
+               "Sunrise", "Glow Guard", "Rosewater", "ClearWave", "GlowPrep", "SmoothStart", "Cloud"]
+
+NAME_WORDS = ["Renewal", "Hydration", "BHA", "Peptide Firming", "Sensitive", "Spot", "Matte Pore",
+              "Barrier", "Retinal", "Antioxidant", "Rescue", "Glycolic", "PHA", "Repair"]
+
+INGREDIENTS = ["Niacinamide", "Hyaluronic Acid", "Vitamin E", "Panthenol", "Allantoin", "Salicylic Acid",
+               "Aloe Vera", "Green-Tea Extract", "Tranexamic Acid", "Willow-Bark", "Ceramides NP+AP+EOP",
+               "Squalane", "Bakuchiol", "Glycerin", "Lactic Acid", "Vitamin C", "Shea Butter",
+               "Zinc Oxide (SPF 50)", "Ceramides", "Argan Oil", "Quinoa Protein", "Ascorbic Acid (Vitamin C)",
+               "Vitamin F (Linoleic Acid)", "Zinc PCA", "Palmitoyl Tripeptide-5", "Centella Asiatica",
+               "Beta-Glucan", "Licorice-Root Extract", "Retinaldehyde", "Ferulic Acid", "Witch Hazel",
+               "Glycolic Acid 5%", "Gluconolactone (PHA)", "Retinol", "Peptides", "Caffeine", "Cocoa Butter",
+               "Titanium Dioxide", "Alpha-Arbutin", "Kaolin Clay", "Charcoal", "Papaya Enzyme"]
+
+TAG_COUNTS = {
+    "hydration": 13, "antiaging": 9, "brightening": 9, "sensitive": 6, "dry-skin": 5, "natural": 4,
+    "barrier-repair": 3, "acne-prone": 3, "pore-care": 3, "oily-skin": 3, "very-dry": 3, "AHA": 3,
+    "combo-skin": 3, "SPF": 3, "sulfate-free": 3, "redness-relief": 2, "matte": 2, "day-cream": 2,
+    "plumping": 2, "protection": 2, "repair": 2, "soothing": 2, "frizz-control": 2, "oily-scalp": 2,
+    "firming": 1, "hyperpigmentation": 1, "fine-lines": 1, "antioxidant": 1, "oily": 1, "BHA": 1,
+    "gentle-exfoliation": 1, "PHA": 1, "night-repair": 1, "eye-care": 1, "wrinkle-care": 1,
+    "spot-corrector": 1, "oil-free": 1, "overnight": 1, "clarifying": 1, "dull-skin": 1,
+    "fragrance-free": 1, "exfoliating": 1, "dandruff": 1, "lightweight": 1, "UV-shield": 1,
+}
+
+BENEFITS = ["smooths fine lines", "drenches skin in long-lasting moisture", "clarifies congested pores",
+            "visibly firms mature skin", "calms redness", "fades dark spots", "minimizes pores",
+            "reinforces the lipid barrier", "brightens uneven tone", "defends against pollution"]
+
+SKIN_TYPES = ["dry", "oily", "combination", "sensitive", "normal"]
+
+TICKET_TEMPLATES = [
+    ("Is {name} safe to use during pregnancy?",
+     "{name} does not contain retinoids or high-dose salicylic acid, but we always recommend checking with your doctor."),
+    ("Does {name} contain fragrance?",
+     "{name} is {fragrance}. The full ingredient list is printed on the box."),
+    ("Can I use {name} with {ingredient}?",
+     "Yes, {name} layers well with {ingredient}; apply the thinner texture first."),
+    ("Will {name} work for {skin_type} skin?",
+     "Customers with {skin_type} skin report good results with {name}, especially in the {time} routine."),
+    ("How long does one bottle of {name} last?",
+     "Used twice daily, one bottle of {name} lasts about {weeks} weeks."),
+]
+
+def generate_catalog(n_products: int, seed: int = 42) -> pd.DataFrame:
+    """Build a catalog DataFrame with the same columns and value formats as 'skincare catalog.xlsx'."""
+    rng = np.random.default_rng(seed)
+    category_names = list(CATEGORIES)
+    category_shares = np.array([count for _, count in CATEGORIES.values()], dtype=float)
+    categories = rng.choice(category_names, n_products, p=category_shares / category_shares.sum())
+    tag_names = list(TAG_COUNTS)
+    tag_shares = np.array(list(TAG_COUNTS.values()), dtype=float)
+    tag_shares /= tag_shares.sum()
+    brands = rng.choice(BRAND_WORDS, n_products)
+    name_words = rng.choice(NAME_WORDS, n_products)
+    benefits = rng.choice(BENEFITS, n_products)
+    n_tags = rng.integers(3, 5, n_products)
+
+    names, descriptions, ingredients, tags = [], [], [], []
+    for i in range(n_products):
+        product_ingredients = rng.choice(INGREDIENTS, 3, replace=False)
+        product_tags = rng.choice(tag_names, n_tags[i], replace=False, p=tag_shares)
+        names.append(f"{brands[i]} {name_words[i]} {categories[i].split(' / ')[-1]}")
+        descriptions.append(f"{categories[i].split(' / ')[-1]} with {product_ingredients[0]} that {benefits[i]}.")
+        ingredients.append("; ".join(product_ingredients))
+        tags.append("|".join(product_tags))
+
+    return pd.DataFrame({
+        "product_id": [f"{CATEGORIES[category][0]}{i + 1:07d}" for i, category in enumerate(categories)],
+        "name": names,
+        "category": categories,
+        "description": descriptions,
+        "top_ingredients": ingredients,
+        "tags": tags,
+        "price (USD)": rng.integers(24, 96, n_products),
+        "margin (%)": np.round(rng.uniform(0.34, 0.55, n_products), 2),
+    }, columns=CATALOG_COLUMNS)
+
+def generate_tickets(catalog: pd.DataFrame, n_tickets: Optional[int] = None, seed: int = 42) -> list:
+    """Build customer-ticket question/answer paragraphs that reference catalog products."""
+    rng = np.random.default_rng(seed)
+    if n_tickets is None:
+        n_tickets = max(50, len(catalog) // 20)
+    product_names = catalog["name"].to_numpy()
+    tickets = []
+    for i in range(n_tickets):
+        question, answer = TICKET_TEMPLATES[rng.integers(len(TICKET_TEMPLATES))]
+        values = {
+            "name": product_names[rng.integers(len(product_names))],
+            "ingredient": rng.choice(INGREDIENTS),
+            "skin_type": rng.choice(SKIN_TYPES),
+            "fragrance": rng.choice(["fragrance-free", "lightly scented with essential oils"]),
+            "time": rng.choice(["morning", "evening"]),
+            "weeks": int(rng.integers(4, 12)),
+        }
+        tickets.append(f"Ticket #{i + 1}\nQ: {question.format(**values)}\nA: {answer.format(**values)}")
+    return tickets
+
+def write_dataset(out_dir: Path, n_products: int, seed: int = 42, excel: bool = True) -> Path:
+    """Write a data/ directory laid out like the bundled one (catalog xlsx + info docx)."""
+    import docx
+
+    data_dir = Path(out_dir) / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    catalog = generate_catalog(n_products, seed)
+    if excel:
+        catalog.to_excel(data_dir / "skincare catalog.xlsx", index=False)
+
+    document = docx.Document()
+    document.add_paragraph("About the brand: synthetic skincare data for benchmarking.")
+    for ticket in generate_tickets(catalog, seed=seed):
+        # process_docs splits chunks on blank lines, so separate tickets with an empty paragraph
+        document.add_paragraph("")
+        for line in ticket.split("\n"):
+            document.add_paragraph(line)
+    document.save(data_dir / "Additional info (brand, reviews, customer tickets).docx")
+    print(f"Wrote {n_products} products to {data_dir}")
+    return data_dir
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    write_dataset(args.out, args.products, args.seed)
@@ -9,6 +9,7 @@ setup(
         "uvicorn",
         "pydantic",
         "pandas",
+        "numpy",
         "openpyxl",
         "chromadb",
         "google-generativeai",
@@ -0,0 +1,74 @@
+import itertools
+
+import pytest
+
+from app.preference_bonus import CONCERN_TERMS, SKIN_TYPE_TERMS, build_bonus_columns, compute_bonus_vector, lookup_bonus
+
+# Every value extract_user_preferences can store
+SKIN_TYPES = [None, 'dry', 'oily', 'combination', 'sensitive']
+CONCERNS = ['acne', 'anti-aging', 'dark_spots', 'hydration']
+
+def original_preference_bonus(product, user_preferences):
+    """Per-request scoring as it was before the bonus table (calculate_preference_bonus, minus logging)."""
+    score = 0.0
+    if user_preferences:
+        if 'skin_type' in user_preferences:
+            skin_type = user_preferences['skin_type']
+            tags_lower = product.get('tags', '').lower()
+            if skin_type == 'dry' and any(term in tags_lower for term in ['hydrating', 'moisturizing', 'nourishing']):
+                score += 1.0
+            elif skin_type == 'oily' and any(term in tags_lower for term in ['oil-free', 'lightweight', 'mattifying']):
+                score += 1.0
+            elif skin_type == 'sensitive' and any(term in tags_lower for term in ['gentle', 'fragrance-free', 'hypoallergenic']):
+                score += 1.0
+        if 'concerns' in user_preferences:
+            concerns = user_preferences['concerns']
+            tags_lower = product.get('tags', '').lower()
+            for concern in concerns:
+                if concern == 'acne' and any(term in tags_lower for term in ['acne', 'blemish', 'salicylic']):
+                    score += 0.8
+                elif concern == 'anti-aging' and any(term in tags_lower for term in ['anti-aging', 'retinol', 'peptide']):
+                    score += 0.8
+                elif concern == 'dark_spots' and any(term in tags_lower for term in ['brightening', 'vitamin c', 'niacinamide']):
+                    score += 0.8
+                elif concern == 'hydration' and any(term in tags_lower for term in ['hydrating', 'hyaluronic', 'moisturizing']):
+                    score += 0.8
+    return score
+
+def all_preferences():
+    for skin_type in SKIN_TYPES:
+        for n in range(len(CONCERNS) + 1):
+            for concerns in itertools.combinations(CONCERNS, n):
+                preferences = {}
+                if skin_type:
+                    preferences['skin_type'] = skin_type
+                if concerns:
+                    preferences['concerns'] = list(concerns)
+                yield preferences
+
+def sample_products():
+    terms = sorted({term for table in (SKIN_TYPE_TERMS, CONCERN_TERMS) for terms in table.values() for term in terms})
+    tag_sets = [[], ['unrelated'], ['hydration', 'dry-skin', 'antiaging'], ['Hydrating', 'OIL-FREE']]
+    tag_sets += [[term] for term in terms]
+    tag_sets += [list(pair) for pair in itertools.combinations(terms, 2)]
+    tag_sets += [list(triple) for triple in itertools.combinations(terms, 3)]
+    return [{'product_id': f'P{i}', 'tags': '|'.join(tags)} for i, tags in enumerate(tag_sets)]
+
+PRODUCTS = sample_products()
+
+@pytest.mark.parametrize("user_preferences", list(all_preferences()), ids=repr)
+def test_lookup_matches_original_scoring(user_preferences):
+    for product in PRODUCTS:
+        expected = original_preference_bonus(product, user_preferences)
+        assert lookup_bonus(compute_bonus_vector(product), user_preferences) == pytest.approx(expected), product['tags']
+
+def test_missing_or_non_string_tags_earn_no_bonus():
+    preferences = {'skin_type': 'dry', 'concerns': CONCERNS}
+    assert lookup_bonus(compute_bonus_vector({'product_id': 'P1'}), preferences) == 0.0
+    assert lookup_bonus(compute_bonus_vector({'product_id': 'P1', 'tags': float('nan')}), preferences) == 0.0
+
+def test_bonus_columns_match_bonus_vectors():
+    columns = build_bonus_columns(PRODUCTS)
+    for i, product in enumerate(PRODUCTS):
+        vector = compute_bonus_vector(product)
+        assert {key: column[i] for key, column in columns.items() if column[i]} == vector, product['tags']
@@ -0,0 +1,79 @@
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.shared_catalog import SharedCatalog, attach_or_build, write_catalog_file
+
+COLUMNS = ["product_id", "name", "tags", "price (USD)", "margin (%)"]
+RECORDS = [
+    {"product_id": "P010", "name": "Gel Cleanser", "tags": "oil-free|gentle", "price (USD)": 12.5, "margin (%)": 40},
+    {"product_id": "P002", "name": "Crème Hydratante 保湿", "tags": "hydrating", "price (USD)": float("nan"),
+     "margin (%)": 35.5},
+    {"product_id": "P007", "name": "", "tags": None, "price (USD)": 30, "margin (%)": float("nan")},
+    {"product_id": "P001", "name": "Sérum ✨ Vitamin C", "tags": float("nan"), "price (USD)": "n/a", "margin (%)": 20},
+]
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = tmp_path / "catalog.bin"
+    write_catalog_file(RECORDS, COLUMNS, path, derived={"margin_bonus": [0.4, 0.355, 0.0, 0.2]})
+    return SharedCatalog(path)
+
+def test_text_columns_round_trip_including_unicode_and_missing_values(catalog):
+    assert len(catalog) == len(RECORDS)
+    assert catalog.columns == COLUMNS
+    assert [p["name"] for p in catalog] == ["Gel Cleanser", "Crème Hydratante 保湿", "", "Sérum ✨ Vitamin C"]
+    # None and NaN text fields read back as empty strings
+    assert [p["tags"] for p in catalog] == ["oil-free|gentle", "hydrating", "", ""]
+
+def test_numeric_columns_keep_nan_for_missing_or_non_numeric_values(catalog):
+    prices = catalog.numeric_column("price (USD)")
+    assert prices[0] == 12.5 and prices[2] == 30.0
+    assert math.isnan(prices[1]) and math.isnan(prices[3])
+    assert math.isnan(catalog[2]["margin (%)"])
+    assert catalog[1]["margin (%)"] == 35.5
+
+def test_rows_behave_like_the_original_records(catalog):
+    product = catalog[-1]
+    record = dict(product)
+    assert math.isnan(record.pop("price (USD)"))
+    assert record == {"product_id": "P001", "name": "Sérum ✨ Vitamin C", "tags": "", "margin (%)": 20.0}
+    assert product.get("missing") is None
+    assert [p["product_id"] for p in catalog[1:3]] == ["P002", "P007"]
+    with pytest.raises(IndexError):
+        catalog[len(RECORDS)]
+
+def test_by_id_finds_every_product_and_misses_unknown_ids(catalog):
+    for row, record in enumerate(RECORDS):
+        product = catalog.by_id(record["product_id"])
+        assert product is not None and product.row == row
+        assert product["name"] == catalog[row]["name"]
+    for missing in ["P000", "P003", "P999", "", "p001"]:
+        assert catalog.by_id(missing) is None
+
+def test_derived_columns_are_shared_views(catalog):
+    column = catalog.derived["margin_bonus"]
+    assert column.tolist() == [0.4, 0.355, 0.0, 0.2]
+    assert not column.flags.writeable
+
+def test_attach_or_build_writes_once_and_replaces_older_versions(tmp_path):
+    source = tmp_path / "catalog.xlsx"
+    source.write_bytes(b"")
+    cache_dir = tmp_path / "cache"
+    stale = cache_dir / "catalog-1-skcat001.bin"
+    cache_dir.mkdir()
+    stale.write_bytes(b"old")
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return RECORDS, COLUMNS
+
+    first = attach_or_build(loader, source, cache_dir, derive=lambda records: {"ones": [1.0] * len(records)})
+    second = attach_or_build(loader, source, cache_dir)
+    assert len(loads) == 1
+    assert first.path == second.path
+    assert second.derived["ones"].tolist() == [1.0] * len(RECORDS)
+    assert not stale.exists()
@@ -4,8 +4,13 @@ import sys
 # Add the current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.main import app
-
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8000))) 
\ No newline at end of file
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        # Multiple workers need an import string; they share the catalog through its memory-mapped file
+        uvicorn.run("app.main:app", host="0.0.0.0", port=int(os.environ.get("PORT", 8000)), workers=workers)
+    else:
+        # Imported only here: with workers the parent process would otherwise load the catalog and models for nothing
+        from app.main import app
+        uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8000)))
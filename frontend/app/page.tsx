@@ -16,7 +16,7 @@ interface Product {
 }
 
 interface SearchResponse {
-  query_type: 'QUESTION' | 'RECOMMENDATION';
+  query_type?: 'QUESTION' | 'RECOMMENDATION';
   answer?: string;
   products?: Product[];
   follow_up_question?: string;
@@ -27,6 +27,30 @@ interface SearchResponse {
 
 const BACKEND_URL = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:8002';
 
+// Parse the Server-Sent Events sent by /search/stream from a fetch response body
+async function readEvents(body: ReadableStream<Uint8Array>, onEvent: (event: string, data: any) => void) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary: number;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      let data = '';
+      frame.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      });
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
 export default function Home() {
   const [query, setQuery] = useState('');
   const [searchResults, setSearchResults] = useState<SearchResponse | null>(null);
@@ -47,7 +71,7 @@ export default function Home() {
         requestBody.session_id = sessionId;
       }
 
-      const response = await fetch(`${BACKEND_URL}/search`, {
+      const response = await fetch(`${BACKEND_URL}/search/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -55,18 +79,43 @@ export default function Home() {
         body: JSON.stringify(requestBody),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         const errorData = await response.json();
         throw new Error(errorData.detail || 'An error occurred during search');
       }
 
-      const data: SearchResponse = await response.json();
-      setSearchResults(data);
-      
-      // Store session ID for future requests
-      if (data.session_id) {
-        setSessionId(data.session_id);
-      }
+      // Render each part as it arrives: query type and products first, then the streamed answer
+      let results: SearchResponse = { session_id: sessionId || '', answer: '' };
+      await readEvents(response.body, (event, data) => {
+        switch (event) {
+          case 'session':
+            results = { ...results, session_id: data.session_id };
+            // Store session ID for future requests
+            setSessionId(data.session_id);
+            return;
+          case 'query_type':
+            results = { ...results, query_type: data.query_type };
+            break;
+          case 'products':
+            results = { ...results, products: data.products, context: data.context };
+            break;
+          case 'answer':
+            results = { ...results, answer: (results.answer || '') + data.text };
+            break;
+          case 'done':
+            results = {
+              ...results,
+              answer: data.answer,
+              follow_up_question: data.follow_up_question,
+              conversation_context: data.conversation_context,
+            };
+            break;
+          case 'error':
+            throw new Error(data.detail || 'An error occurred during search');
+        }
+        setSearchResults(results);
+        setLoading(false);
+      });
     } catch (err) {
       console.error('Search API error:', err);
       setError(err instanceof Error ? err.message : 'An unknown error occurred');